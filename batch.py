@@ -0,0 +1,712 @@
+#
+#  batch.py
+#
+#    Conversion of lists of files (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+"""
+Run a `SourceProcessor' over a list of files and write the results.
+
+By default every file is converted in this process, one after another.
+With `utils.jobs' above one, files are converted by a pool of worker
+processes, see `scheduler.py' for the order in which they are handed
+out.  With `utils.keep_going' set, a file that raises an exception or
+exceeds `utils.timeout' seconds is recorded as a failure, its worker is
+replaced if necessary, and the run goes on with the next file.
+
+Typical usage:
+    import batch
+    batch.process_files( file_list, type = 2 )
+"""
+from __future__ import print_function
+
+from sources import SourceProcessor
+
+import markdown_utils as mdutils
+import callprofile, export, gitutils, instrument, journal, memprofile
+import scheduler, shards
+import timeline, utils
+
+import sys, os, json, time, traceback, collections
+import multiprocessing, multiprocessing.connection
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+
+def  options():
+    """Return the settings of `utils' that workers need to know about."""
+    return { "block_tables" : utils.block_tables,
+             "compress"     : utils.compress,
+             "link"         : utils.link,
+             "bytes_mode"   : utils.bytes_mode,
+             "flush_to_file": utils.flush_to_file,
+             "output_dir"   : utils.output_dir,
+             "memprofile"   : utils.memprofile,
+             "memdepth"     : utils.memdepth,
+             "profile"      : utils.profile,
+             "trace"        : utils.trace,
+             "export"       : utils.export,
+             "only_sections": utils.only_sections,
+             "only_symbols" : utils.only_symbols,
+             "only_tags"    : utils.only_tags,
+             "rev"          : utils.rev,
+             "blobs"        : utils.blobs }
+
+
+def  convert_file( processor, filename ):
+    """Parse and convert a single file.  Returns the output text (bytes
+       with `utils.bytes_mode'), or None if the output file was written
+       as a copy of the input, see `utils.copy_source'."""
+    with instrument.stage( "file", filename ):
+        with instrument.stage( "read" ):
+            text, data = utils.read_input( filename )
+        if data is None or not processor.unchanged( text ):
+            with instrument.stage( "parse" ):
+                blocks = list( processor.scan_blocks( text, filename ) )
+            if data is None or processor.changed:
+                if utils.bytes_mode:
+                    return utils.blocks_to_bytes( blocks )
+                return utils.blocks_to_text( blocks )
+
+        with instrument.stage( "copy", filename ):
+            utils.copy_source( filename, data )
+        instrument.count( "files copied" )
+        return None
+
+
+def  convert_text( processor, source, name ):
+    """Parse and convert C source held in a string.  Returns the output
+       text."""
+    with instrument.stage( "file", name ):
+        blocks = list( processor.scan_blocks( source, name ) )
+        return utils.blocks_to_text( blocks )
+
+
+def  write_text( text, filename ):
+    """Write the output text of a file."""
+    with instrument.stage( "write", filename ):
+        utils.write_text( text, filename )
+
+
+def  start_instruments( role = "main" ):
+    """Install the stage listeners asked for by the options in `utils'.
+       `role' names the process in a timeline."""
+    del instrument.listeners[:]
+    if utils.memprofile:
+        profile = memprofile.MemoryProfile( utils.memdepth )
+        profile.start()
+        instrument.listeners.append( profile )
+    if utils.profile:
+        instrument.listeners.append( callprofile.CallProfile() )
+    if utils.trace:
+        instrument.listeners.append( timeline.Timeline( role ) )
+    if utils.export:
+        instrument.listeners.append( export.Exporter() )
+
+
+def  write_reports():
+    """Write the reports of the listeners from `start_instruments'."""
+    for listener in instrument.listeners:
+        if listener.key == "memory":
+            listener.write( utils.memprofile )
+        if listener.key == "profile":
+            listener.write( utils.profile )
+        if listener.key == "trace":
+            listener.write( utils.trace )
+        if listener.key == "export":
+            listener.write( utils.export )
+
+
+################################################################
+##
+##  WORKER PROCESS
+##
+##  A worker receives lists of file names over a pipe and answers with
+##  one `( filename, text, error, data )' tuple per file, where `error'
+##  is a formatted traceback or None, and `data' is what the worker's
+##  stage listeners collected (see `instrument.take').  Instead of a file
+##  name, an entry can be a `( name, source )' tuple with the C source
+##  itself.  `None' instead of a list stops the worker.
+##
+##  With `utils.flush_to_file' set, the worker writes the output files of
+##  the files it converts itself and answers with None as `text'.  Other
+##  texts of at least `shared_min' bytes are sent in a shared memory
+##  block, named by a `( name, size, binary )' tuple in place of `text'
+##  (`binary' tells bytes of `utils.bytes_mode' from text), so that they
+##  are not pickled and copied through the pipe; `Worker.receive' gets
+##  them back.
+##
+
+# Texts with fewer bytes in UTF-8 are sent through the pipe
+#
+shared_min = 65536
+
+
+def  pack_text( text ):
+    """Return what a worker sends for `text', see above."""
+    if text is None or shared_memory is None:
+        return text
+    binary = isinstance( text, bytes )
+    if len( text ) * ( 1 if binary else 4 ) < shared_min:
+        # too short even with four bytes per character
+        return text
+    data = text if binary else text.encode( "utf-8", "surrogatepass" )
+    if len( data ) < shared_min:
+        return text
+    block = shared_memory.SharedMemory( create = True, size = len( data ) )
+    block.buf[:len( data )] = data
+    # the parent unlinks it; don't let this process clean it up at exit
+    # (blocks are only tracked on POSIX, by their name with a slash)
+    if os.name == "posix":
+        resource_tracker.unregister( "/" + block.name, "shared_memory" )
+    block.close()
+    return ( block.name, len( data ), binary )
+
+
+def  unpack_text( text ):
+    """Return the text sent by `pack_text', and free its memory."""
+    if not isinstance( text, tuple ):
+        return text
+    name, size, binary = text
+    block = shared_memory.SharedMemory( name = name )
+    try:
+        data = bytes( block.buf[:size] )
+        return data if binary else data.decode( "utf-8", "surrogatepass" )
+    finally:
+        block.close()
+        block.unlink()
+
+
+def  worker_main( conn, type, settings ):
+    for name, value in settings.items():
+        setattr( utils, name, value )
+    start_instruments( "worker" )
+
+    processor = SourceProcessor( type )
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+
+        for filename in task:
+            try:
+                if isinstance( filename, tuple ):
+                    filename, source = filename
+                    text = convert_text( processor, source, filename )
+                else:
+                    text = convert_file( processor, filename )
+                    if utils.flush_to_file and text is not None:
+                        write_text( text, filename )
+                        text = None
+                conn.send( ( filename, pack_text( text ), None,
+                             instrument.take() ) )
+            except Exception:
+                conn.send( ( filename, None, traceback.format_exc(),
+                             instrument.take() ) )
+                # don't trust state left behind by the failed file
+                mdutils.reset()
+                processor = SourceProcessor( type )
+
+    conn.close()
+
+
+class  Worker:
+
+    def  __init__( self, type ):
+        """Start a worker process converting files of the given type."""
+        self.conn, child = multiprocessing.Pipe()
+        self.process     = multiprocessing.Process( target = worker_main,
+                                                    args = ( child, type,
+                                                             options() ) )
+        self.process.daemon = True
+        self.process.start()
+        child.close()
+
+    def  send( self, filenames ):
+        self.conn.send( filenames )
+
+    def  receive( self, timeout = None ):
+        """Wait for the next result.  Returns None if nothing arrived in
+           time; raises EOFError if the worker died."""
+        if timeout is not None and not self.conn.poll( timeout ):
+            return None
+        filename, text, error, data = self.conn.recv()
+        return filename, unpack_text( text ), error, data
+
+    def  stop( self ):
+        try:
+            self.conn.send( None )
+        except ( IOError, OSError ):
+            pass
+        self.process.join( 1 )
+        self.kill()
+
+    def  kill( self ):
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        # free the shared memory of answers that were not received
+        try:
+            while self.conn.poll():
+                self.receive()
+        except ( EOFError, IOError, OSError ):
+            pass
+        self.conn.close()
+
+
+################################################################
+##
+##  BLOCK POOL
+##
+##  With `utils.block_jobs' above one, the documentation blocks of a
+##  large file are converted by a pool of processes: the file is split
+##  into blocks here, the blocks to convert are cut into runs of
+##  consecutive blocks, one per task, and the results are put back in
+##  place.  A run starts with the state of a fresh file.  `Markify' can
+##  leave a code sequence open at the end of a block; if a run ends with
+##  one, the blocks after it are converted again here, in order.
+##
+
+# Files with fewer blocks to convert are converted in this process
+#
+min_pool_blocks = 64
+
+# Number of runs per process, to even out their work
+#
+runs_per_job = 4
+
+block_pools = {}        # type -> `multiprocessing.Pool'
+block_converter = None  # the converter of a block pool process
+
+
+def  block_worker_init( type, settings ):
+    global block_converter
+    for name, value in settings.items():
+        setattr( utils, name, value )
+    block_converter = SourceProcessor( type ).converter
+
+
+def  convert_run( run ):
+    """Convert a list of blocks, given as lists of lines, in a block pool
+       process.  Returns the converted blocks and the state left to the
+       next block (see `mdutils.save')."""
+    mdutils.reset()
+    lines = [block_converter.convert( block ) for block in run]
+    return lines, mdutils.save()
+
+
+def  block_pool( type ):
+    if type not in block_pools:
+        block_pools[type] = multiprocessing.Pool( utils.block_jobs,
+                                                  block_worker_init,
+                                                  ( type, options() ) )
+    return block_pools[type]
+
+
+def  stop_block_pools():
+    for pool in block_pools.values():
+        pool.terminate()
+        pool.join()
+    block_pools.clear()
+
+
+def  convert_blocks( processor, filename, type ):
+    """Like `convert_file', but with the blocks converted by the block
+       pool if there are at least `min_pool_blocks' of them."""
+    with instrument.stage( "file", filename ):
+        text = processor.read_file( filename )
+        with instrument.stage( "parse" ):
+            processor.deferred = []
+            try:
+                blocks = list( processor.scan_blocks( text, filename ) )
+                lines  = set( processor.deferred )
+            finally:
+                processor.deferred = None
+
+        todo = [block for block in blocks
+                if block.documentation and block.lineno in lines]
+        rest = todo
+        if len( todo ) >= min_pool_blocks:
+            rest    = []
+            size    = -( -len( todo ) // ( utils.block_jobs * runs_per_job ) )
+            starts  = range( 0, len( todo ), size )
+            results = block_pool( type ).map(
+                        convert_run,
+                        [[block.lines for block in todo[start:start + size]]
+                         for start in starts] )
+            for start, ( lines, state ) in zip( starts, results ):
+                for block, new in zip( todo[start:start + size], lines ):
+                    block.lines = new
+                if state:
+                    # the next runs lacked this code sequence
+                    instrument.count( "block runs redone" )
+                    rest = todo[start + size:]
+                    mdutils.restore( state )
+                    break
+
+        with instrument.stage( "convert" ):
+            for block in rest:
+                block.lines = processor.converter.convert( block.lines )
+        if processor.exporter:
+            for block in todo:
+                processor.exporter.block( filename, block.lineno,
+                                          block.lines )
+
+        return utils.blocks_to_text( blocks )
+
+
+################################################################
+##
+##  BATCH RUNS
+##
+
+def  size( filename ):
+    """Return the size of an input file, in the work tree or in
+       `utils.rev'."""
+    if filename in utils.blobs:
+        return utils.blobs[filename][1]
+    return os.path.getsize( filename )
+
+
+def  cost( filename ):
+    """Estimate the cost of converting an input file from its size, see
+       `scheduler'."""
+    if filename in utils.blobs:
+        return utils.blobs[filename][1]
+    return scheduler.estimate_cost( filename )
+
+
+def  select_files( file_list ):
+    """Apply the file selection options to `file_list'."""
+    file_list = list( file_list or [] )
+
+    if utils.shard:
+        file_list = shards.select( file_list, utils.shard[0], utils.shard[1],
+                                   size )
+
+    if utils.since and utils.rev:
+        sys.stderr.write( "--since cannot be combined with --rev\n" )
+        sys.exit( 2 )
+
+    if utils.since:
+        try:
+            file_list = gitutils.changed_since( file_list, utils.since )
+        except gitutils.GitError as e:
+            sys.stderr.write( str( e ) + "\n" )
+            sys.exit( 2 )
+
+    return file_list
+
+
+def  process_stream( type, input = None, output = None ):
+    """Filter mode: convert C source from `input' (default stdin) and
+       write the result to `output' (default stdout).  Every block is
+       written and flushed as soon as it is complete."""
+    input  = input or sys.stdin
+    output = output or sys.stdout
+
+    source_processor = SourceProcessor( type )
+    # read line by line, not in chunks, to keep the latency low
+    lines = iter( input.readline, "" )
+    for block in source_processor.iter_blocks( lines, "-" ):
+        output.write( "".join( block.lines ) )
+        output.flush()
+
+
+def  process_range( filename, type ):
+    """Convert the documentation block at `utils.line_range' of a file
+       (or stdin for `-') and print its span and text as JSON.  Returns 1
+       if there is no such block."""
+    if filename == "-":
+        source = sys.stdin.read()
+    else:
+        source = utils.read_source( filename )
+
+    first, last = utils.line_range
+    result = SourceProcessor( type ).convert_range( source, first, last,
+                                                    filename )
+    if result is None:
+        sys.stderr.write( "%s: no documentation block contains lines %d-%d\n"
+                          % ( filename, first, last ) )
+        return 1
+
+    start, end, lines = result
+    print( json.dumps( { "file" : filename,
+                         "start": start,
+                         "end"  : end,
+                         "text" : "".join( lines ) } ) )
+    return 0
+
+
+def  process_files( file_list, type = 1 ):
+    """Convert all files in `file_list' and write the results.  Returns
+       the number of files that failed."""
+    if utils.line_range:
+        if not file_list or len( file_list ) != 1:
+            sys.stderr.write( "--line and --range need a single input\n" )
+            sys.exit( 2 )
+        return process_range( file_list[0], type )
+
+    if file_list and "-" in file_list:
+        if len( file_list ) > 1:
+            sys.stderr.write( "'-' cannot be combined with other inputs\n" )
+            sys.exit( 2 )
+        process_stream( type )
+        return 0
+
+    file_list = select_files( file_list )
+    todo, log = file_list, None
+    if utils.resume:
+        if not utils.flush_to_file:
+            sys.stderr.write( "--resume needs an output directory\n" )
+            sys.exit( 2 )
+        log  = journal.Journal( utils.output_dir, type )
+        todo = [f for f in file_list if not log.done( f )]
+        if len( todo ) < len( file_list ):
+            sys.stderr.write( "resuming: %d of %d files already converted\n"
+                              % ( len( file_list ) - len( todo ),
+                                  len( file_list ) ) )
+
+    start_instruments()
+    if utils.keep_going or utils.jobs > 1:
+        failed = process_pool( todo, type, log )
+    else:
+        failed = []
+        source_processor = SourceProcessor( type )
+        for filename in todo:
+            if utils.block_jobs > 1 and not utils.bytes_mode:
+                text = convert_blocks( source_processor, filename, type )
+            else:
+                text = convert_file( source_processor, filename )
+            if text is not None:
+                write_text( text, filename )
+            if log:
+                log.add( filename )
+        stop_block_pools()
+    if log:
+        log.close()
+
+    if utils.shard and utils.flush_to_file:
+        written = [utils.output_name( f ) for f in file_list
+                   if f not in failed]
+        shards.write_manifest( utils.output_dir, utils.shard[0],
+                               utils.shard[1], written )
+
+    write_reports()
+    if utils.stats:
+        print_stats()
+    return len( failed )
+
+
+class  Slot:
+    """Bookkeeping for one worker of the pool."""
+
+    def  __init__( self, number ):
+        self.number   = number
+        self.worker   = None
+        self.files    = None    # entries of the task not yet done
+        self.started  = 0       # when the current task was sent
+        self.deadline = None    # when the current file times out
+        self.busy     = 0.0
+        self.tasks    = 0
+        self.done     = 0
+        self.history  = []      # ( start, end, outcome ) of every task
+
+    def  finish( self, now, outcome = "done" ):
+        """Account for the current task as finished."""
+        self.busy  += now - self.started
+        self.tasks += 1
+        self.files  = None
+        self.history.append( ( self.started, now, outcome ) )
+
+    def  drop( self, now, outcome ):
+        """Give up on the worker; return the files left of its task."""
+        rest = self.files[1:]
+        self.worker.kill()
+        self.worker = None
+        self.finish( now, outcome )
+        return rest
+
+
+def  process_pool( file_list, type, log = None ):
+    """Convert files in `utils.jobs' worker processes.  Files are handed
+       out as tasks by `scheduler.schedule'.  With `utils.keep_going',
+       exceptions and timeouts are recorded and the run continues;
+       otherwise the first failure stops it.  Files converted are added
+       to `log', a `journal.Journal', if given.  Returns the list of
+       files that failed."""
+    jobs     = max( 1, utils.jobs )
+    # tasks hold `( index, filename )' entries of the file list, so that
+    # a file named twice is put in its place twice
+    tasks    = collections.deque( scheduler.schedule(
+                 list( enumerate( file_list ) ), jobs,
+                 lambda entry: cost( entry[1] ) ) )
+    slots    = [Slot( i + 1 ) for i in range( jobs )]
+    failures = []
+    timeout  = utils.timeout if utils.keep_going else None
+
+    # output to the terminal keeps the order of the file list
+    pending  = {}
+    next_out = [0]
+
+    def  output( index, filename, text ):
+        if utils.flush_to_file:
+            if text is not None:
+                write_text( text, filename )
+            return
+        pending[index] = ( filename, text )
+        while next_out[0] in pending:
+            name, text = pending.pop( next_out[0] )
+            if text is not None:
+                write_text( text, name )
+            next_out[0] += 1
+
+    def  fail( index, filename, error ):
+        failures.append( ( filename, error ) )
+        sys.stderr.write( "failed: " + filename + "\n" )
+        output( index, filename, None )
+
+    begin = time.time()
+    while True:
+        now = time.time()
+        for slot in slots:
+            if slot.files is None and tasks:
+                if slot.worker is None:
+                    slot.worker = Worker( type )
+                task          = tasks.popleft()
+                slot.files    = list( task.files )
+                slot.started  = now
+                slot.deadline = now + timeout if timeout else None
+                slot.worker.send( [f for i, f in slot.files] )
+
+        busy = [slot for slot in slots if slot.files]
+        if not busy or ( failures and not utils.keep_going ):
+            break
+
+        wait = None
+        if timeout:
+            wait = max( 0, min( slot.deadline for slot in busy ) - now )
+        ready = multiprocessing.connection.wait(
+                  [slot.worker.conn for slot in busy], wait )
+
+        now = time.time()
+        for slot in busy:
+            if slot.worker.conn in ready:
+                try:
+                    filename, text, error, data = slot.worker.receive()
+                except ( EOFError, IOError, OSError ):
+                    index, filename = slot.files[0]
+                    rest = slot.drop( now, "worker died" )
+                    if rest:
+                        tasks.appendleft( scheduler.Task( rest, 0 ) )
+                    fail( index, filename, "worker process died\n" )
+                    continue
+
+                instrument.merge( data )
+                slot.done += 1
+                index = slot.files.pop( 0 )[0]
+                if error:
+                    fail( index, filename, error )
+                else:
+                    output( index, filename, text )
+                    if log:
+                        log.add( filename )
+                if slot.files:
+                    slot.deadline = now + timeout if timeout else None
+                else:
+                    slot.finish( now )
+
+            elif timeout and now >= slot.deadline:
+                # the worker is stuck; replace it and requeue the rest
+                index, filename = slot.files[0]
+                rest = slot.drop( now, "timed out" )
+                if rest:
+                    tasks.appendleft( scheduler.Task( rest, 0 ) )
+                fail( index, filename, "timed out after " + str( timeout )
+                                       + " seconds\n" )
+
+    for slot in slots:
+        if slot.worker:
+            if slot.files:
+                slot.worker.kill()
+            else:
+                slot.worker.stop()
+
+    if utils.jobs > 1:
+        utilisation( slots, time.time() - begin )
+
+    tracer = instrument.find( "trace" )
+    if tracer:
+        for slot in slots:
+            tracer.thread( slot.number, "slot %d" % slot.number )
+            for started, end, outcome in slot.history:
+                tracer.add( "task", started, end, slot.number,
+                            { "outcome": outcome } )
+
+    if failures and not utils.keep_going:
+        filename, error = failures[0]
+        sys.stderr.write( error )
+    elif failures:
+        summary( failures, len( file_list ) )
+    return [filename for filename, error in failures]
+
+
+def  utilisation( slots, wall ):
+    """Print how busy each worker was to stderr."""
+    sys.stderr.write( "worker  tasks  files      busy   util\n" )
+    total = 0.0
+    for slot in slots:
+        total += slot.busy
+        sys.stderr.write( "%6d %6d %6d %8.2fs %5.1f%%\n"
+                          % ( slot.number, slot.tasks, slot.done, slot.busy,
+                              100 * slot.busy / wall if wall else 0 ) )
+    sys.stderr.write( "wall time %.2fs, utilisation %.1f%%\n"
+                      % ( wall, 100 * total / ( wall * len( slots ) )
+                                if wall else 0 ) )
+
+
+def  print_stats():
+    """Print the counts of converted and passed through blocks and files
+       to stderr."""
+    counters = instrument.counters
+    prefix   = "blocks passed through: "
+    kinds    = sorted( ( name[len( prefix ):], n )
+                       for name, n in counters.items()
+                       if name.startswith( prefix ) )
+    sys.stderr.write( "blocks: %d converted, %d passed through"
+                      % ( counters.get( "blocks converted", 0 ),
+                          sum( n for kind, n in kinds ) ) )
+    if kinds:
+        sys.stderr.write( " (" + ", ".join( "%s %d" % kind
+                                            for kind in kinds ) + ")" )
+    sys.stderr.write( "\nfiles: %d, %d unchanged, %d passed through whole, "
+                      "%d copied\n"
+                      % ( counters.get( "files", 0 ),
+                          counters.get( "files unchanged", 0 ),
+                          counters.get( "files passed through", 0 ),
+                          counters.get( "files copied", 0 ) ) )
+
+
+def  summary( failures, total ):
+    """Print the failure summary to stderr."""
+    sys.stderr.write( "\n" + str( len( failures ) ) + " of " + str( total )
+                      + " files failed:\n" )
+    for filename, error in failures:
+        sys.stderr.write( "\n" + filename + "\n" )
+        for line in error.rstrip().split( "\n" ):
+            sys.stderr.write( "    " + line + "\n" )
+
+# eof
@@ -0,0 +1,418 @@
+#!/usr/bin/env python
+#
+#  benchmark.py
+#
+#    Performance regression gate for the conversion engines.
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+"""
+Run a fixed, seeded workload through `Converter', `Markify' and
+`SourceProcessor', and compare throughput and peak memory against the
+baseline stored in `benchmark_baseline.json'.
+
+Timings are normalized by a short calibration loop, so that a baseline
+recorded on one machine stays meaningful on another.  Every workload is
+repeated several times; the median is compared, and the allowed drop is
+widened by the measured run-to-run noise, up to `max_tolerance'.  A
+workload that looks slower is measured a second time before the gate
+fails.
+
+The gate also times the crafted lines of `workload.adversarial' at two
+lengths.  A line four times as long must not take much more than four
+times as long, and no line may take more than a fixed number of
+calibration units: a malformed comment must never stall a build.  A
+baseline is not stored while this check fails.
+"""
+from __future__ import print_function
+
+import converter, markdown, sources, workload
+
+import sys, os, getopt, json, random, re, shutil, tempfile, time
+import platform, tracemalloc
+
+
+# default location of the stored baseline
+#
+baseline_file = os.path.join( os.path.dirname( os.path.abspath( __file__ ) ),
+                              "benchmark_baseline.json" )
+
+# workload parameters; changing them invalidates the stored baseline
+#
+seed         = 20180601
+block_count  = 200
+header_count = 8
+
+repeat           = 7
+tolerance        = 0.15   # allowed relative throughput drop
+memory_tolerance = 0.10   # allowed relative peak memory growth
+memory_slack     = 65536  # growth in bytes that is never reported
+noise_factor     = 3.0    # how many noise units a drop must exceed
+max_tolerance    = 0.30   # limit of the widening by noise
+
+adversarial_count  = 1000   # repeat count of the shorter adversarial lines
+adversarial_growth = 8.0    # allowed time ratio for four times the count
+adversarial_budget = 60.0   # allowed calibration units per longer line
+
+
+def  usage():
+    print( "\nBenchmark Usage information\n" )
+    print( "  benchmark [options]\n" )
+    print( "using the following options:\n" )
+    print( "  -h : print this page" )
+    print( "  -u : store the results as the new baseline" )
+    print( "  -b : use another baseline file, as in '-b base.json'" )
+    print( "  -r : number of timed runs per workload (default 7)" )
+    print( "  -t : allowed throughput drop in percent (default 15)" )
+    print( "  -m : allowed peak memory growth in percent (default 10)" )
+    print( "  -a : only time the adversarial lines" )
+    print( "" )
+    print( "  --update, --baseline=FILE, --repeat=N, --tolerance=PCT," )
+    print( "  --memory-tolerance=PCT, --adversarial : long forms of the" )
+    print( "  above" )
+
+
+################################################################
+##
+##  WORKLOADS
+##
+##  Each workload is a `( name, setup, run, cleanup )' tuple.  `setup' is
+##  called once and returns the data handed to `run' and `cleanup'; `run'
+##  returns the number of lines it processed.
+##
+
+def  setup_converter():
+    rng = random.Random( seed )
+    return [ workload.heavy_block( rng ) for i in range( block_count ) ]
+
+
+def  run_converter( blocks ):
+    c     = converter.Converter()
+    total = 0
+    for lines in blocks:
+        total += len( c.convert( lines ) )
+    return total
+
+
+def  setup_markify():
+    rng = random.Random( seed + 1 )
+    return [ workload.light_block( rng ) for i in range( block_count ) ]
+
+
+def  run_markify( blocks ):
+    m     = markdown.Markify()
+    total = 0
+    for lines in blocks:
+        total += len( m.convert( lines ) )
+    return total
+
+
+def  setup_sources():
+    rng     = random.Random( seed + 2 )
+    tmpdir  = tempfile.mkdtemp( prefix = "ftdocs-bench-" )
+    headers = []
+    for i in range( header_count ):
+        light    = i % 2 == 1
+        filename = os.path.join( tmpdir, "header%d.h" % i )
+        with open( filename, "w" ) as f:
+            f.writelines( workload.header( rng, block_count // header_count,
+                                           light ) )
+        headers.append( ( filename, 2 if light else 1 ) )
+    return headers
+
+
+def  run_sources( headers ):
+    total      = 0
+    processors = { 1: sources.SourceProcessor( type = 1 ),
+                   2: sources.SourceProcessor( type = 2 ) }
+    for filename, type in headers:
+        for block in processors[type].parse_file( filename ):
+            total += len( block.lines )
+    return total
+
+
+def  cleanup_sources( headers ):
+    if headers:
+        shutil.rmtree( os.path.dirname( headers[0][0] ), True )
+
+
+def  run_adversarial( text ):
+    """Convert the blocks of `workload.adversarial_blocks' with both
+       engines, directly and as part of a file."""
+    heavy, light = workload.adversarial_blocks( text )
+    converter.Converter().convert( heavy )
+    markdown.Markify().convert( light )
+    list( sources.SourceProcessor( 1 ).scan_blocks( "".join( heavy ) ) )
+    list( sources.SourceProcessor( 2 ).scan_blocks( "".join( light ) ) )
+
+
+workloads = [ ( "converter", setup_converter, run_converter, None ),
+              ( "markify",   setup_markify,   run_markify,   None ),
+              ( "sources",   setup_sources,   run_sources,   cleanup_sources ) ]
+
+
+################################################################
+##
+##  MEASUREMENT
+##
+
+def  calibrate():
+    """Time a fixed mix of regex and string work that resembles the
+       engines.  Throughput is expressed in lines per calibration unit,
+       which cancels out most of the speed difference between machines.
+       The unit is measured again next to every timed run, so that a
+       machine whose speed drifts during the benchmark is accounted for
+       as well."""
+    pattern = re.compile( r"\s*/\*{1}([^*].*)\*{1}/\s*$" )
+    line    = "  /*    This section contains the declaration of functions.  */\n"
+    best    = None
+    for i in range( 3 ):
+        start = time.perf_counter()
+        for j in range( 5000 ):
+            m = pattern.match( line )
+            s = m.group( 1 ).rstrip() + "\n"
+            s = s.replace( "`", "'" ).split( " " )
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def  median( values ):
+    values = sorted( values )
+    n      = len( values )
+    if n % 2:
+        return values[n // 2]
+    return ( values[n // 2 - 1] + values[n // 2] ) / 2.0
+
+
+def  relative_noise( values ):
+    """Return the median absolute deviation of `values', scaled to
+       estimate a standard deviation, relative to their median."""
+    med = median( values )
+    if med == 0:
+        return 0.0
+    mad = median( [ abs( v - med ) for v in values ] )
+    return 1.4826 * mad / med
+
+
+def  measure( name, setup, run, cleanup, runs ):
+    """Measure one workload.  Returns a result dictionary."""
+    data = setup()
+    try:
+        run( data )     # warm-up: compiled regex cache, imports
+        rates = []
+        lines = 0
+        for i in range( runs ):
+            unit    = calibrate()
+            start   = time.perf_counter()
+            lines   = run( data )
+            elapsed = time.perf_counter() - start
+            unit    = ( unit + calibrate() ) / 2
+            rates.append( lines / ( elapsed / unit ) )
+
+        tracemalloc.start()
+        run( data )
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        if cleanup:
+            cleanup( data )
+
+    return { "lines"      : lines,
+             "throughput" : median( rates ),
+             "noise"      : relative_noise( rates ),
+             "peak_memory": peak }
+
+
+def  compare( name, result, base ):
+    """Compare a result against its baseline entry.  Returns a list of
+       failure messages (empty if the workload passed)."""
+    failures = []
+
+    # a noisy run must not hide a real drop
+    allowed = max( tolerance,
+                   min( max_tolerance, noise_factor * result["noise"] ) )
+    drop    = 1.0 - result["throughput"] / base["throughput"]
+    if drop > allowed:
+        failures.append( "%s: throughput dropped by %.1f%% (allowed %.1f%%)"
+                         % ( name, 100 * drop, 100 * allowed ) )
+
+    grown  = result["peak_memory"] - base["peak_memory"]
+    growth = float( grown ) / base["peak_memory"]
+    if growth > memory_tolerance and grown > memory_slack:
+        failures.append( "%s: peak memory grew by %.1f%% (allowed %.1f%%)"
+                         % ( name, 100 * growth, 100 * memory_tolerance ) )
+    return failures
+
+
+def  adversarial():
+    """Time every adversarial line at two lengths.  Returns a list of
+       failure messages."""
+    failures = []
+    for name, make in workload.adversarial:
+        times = []
+        for count in ( adversarial_count, 4 * adversarial_count ):
+            text = make( count )
+            best = None
+            for i in range( 3 ):
+                start   = time.perf_counter()
+                run_adversarial( text )
+                elapsed = time.perf_counter() - start
+                if best is None or elapsed < best:
+                    best = elapsed
+            times.append( best / calibrate() )
+
+        short, long = times
+        print( "%-16s %8.2f units  %8.2f units x4" % ( name, short, long ) )
+        if long > adversarial_budget:
+            failures.append( "%s: %.1f calibration units (allowed %.1f)"
+                             % ( name, long, adversarial_budget ) )
+        elif long > adversarial_growth * max( short, 0.1 ):
+            failures.append( "%s: %.1f times slower for a line four times "
+                             "as long (allowed %.1f)"
+                             % ( name, long / short, adversarial_growth ) )
+    return failures
+
+
+def  report( name, result, base ):
+    line = "%-10s %10.1f lines/unit  noise %4.1f%%  peak %8d bytes" \
+           % ( name, result["throughput"], 100 * result["noise"],
+               result["peak_memory"] )
+    if base:
+        line += "  (%+.1f%% / %+.1f%%)" % (
+            100 * ( result["throughput"] / base["throughput"] - 1 ),
+            100 * ( float( result["peak_memory"] ) / base["peak_memory"] - 1 ) )
+    print( line )
+
+
+def  parameters():
+    return { "seed"         : seed,
+             "block_count"  : block_count,
+             "header_count" : header_count }
+
+
+def  main( argv ):
+    """Main program loop."""
+
+    global baseline_file, repeat, tolerance, memory_tolerance
+
+    try:
+        opts, args = getopt.getopt( sys.argv[1:],
+                                    "hub:r:t:m:a",
+                                    ["help", "update", "baseline=", "repeat=",
+                                     "tolerance=", "memory-tolerance=",
+                                     "adversarial"] )
+    except getopt.GetoptError:
+        usage()
+        sys.exit( 2 )
+
+    update = False
+    only_adversarial = False
+
+    try:
+        for opt in opts:
+            if opt[0] in ( "-h", "--help" ):
+                usage()
+                sys.exit( 0 )
+
+            if opt[0] in ( "-u", "--update" ):
+                update = True
+
+            if opt[0] in ( "-b", "--baseline" ):
+                baseline_file = opt[1]
+
+            if opt[0] in ( "-r", "--repeat" ):
+                repeat = max( 3, int( opt[1] ) )
+
+            if opt[0] in ( "-t", "--tolerance" ):
+                tolerance = float( opt[1] ) / 100
+
+            if opt[0] in ( "-m", "--memory-tolerance" ):
+                memory_tolerance = float( opt[1] ) / 100
+
+            if opt[0] in ( "-a", "--adversarial" ):
+                only_adversarial = True
+    except ValueError:
+        usage()
+        sys.exit( 2 )
+
+    if only_adversarial:
+        failed = adversarial()
+        for message in failed:
+            sys.stderr.write( message + "\n" )
+        sys.exit( 1 if failed else 0 )
+
+    baseline = None
+    if not update:
+        try:
+            with open( baseline_file ) as f:
+                baseline = json.load( f )
+        except IOError:
+            sys.stderr.write( "no baseline at '" + baseline_file + "', "
+                              + "run with -u to create one\n" )
+            sys.exit( 2 )
+
+        if baseline.get( "parameters" ) != parameters():
+            sys.stderr.write( "baseline was recorded with a different "
+                              + "workload, run with -u to refresh it\n" )
+            sys.exit( 2 )
+
+        if baseline.get( "python" ) != platform.python_version():
+            sys.stderr.write( "warning: baseline was recorded with Python "
+                              + str( baseline.get( "python" ) )
+                              + ", memory figures may differ\n" )
+
+    results = {}
+    failed  = []
+
+    for name, setup, run, cleanup in workloads:
+        result = measure( name, setup, run, cleanup, repeat )
+        base   = baseline["results"].get( name ) if baseline else None
+
+        if base and compare( name, result, base ):
+            # could be a noisy neighbour; measure once more, with more
+            # runs, before failing
+            result = measure( name, setup, run, cleanup, 2 * repeat )
+
+        report( name, result, base )
+        results[name] = result
+        if base:
+            failed += compare( name, result, base )
+
+    failed += adversarial()
+
+    if update and failed:
+        for message in failed:
+            sys.stderr.write( message + "\n" )
+        sys.stderr.write( "baseline not written to '" + baseline_file
+                          + "'\n" )
+        sys.exit( 1 )
+
+    if update:
+        with open( baseline_file, "w" ) as f:
+            json.dump( { "parameters": parameters(),
+                         "python"    : platform.python_version(),
+                         "results"   : results },
+                       f, indent = 2, sort_keys = True )
+            f.write( "\n" )
+        print( "baseline written to", baseline_file )
+        return
+
+    for message in failed:
+        sys.stderr.write( message + "\n" )
+    if failed:
+        sys.exit( 1 )
+
+
+# if called from the command line
+if __name__ == '__main__':
+    main( sys.argv )
+
+# eof
@@ -0,0 +1,101 @@
+#
+#  blockfilter.py
+#
+#    Select the documentation blocks to convert (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Convert only some of the documentation blocks, e.g. those of a section,
+and pass all others through as they are.
+
+A `BlockFilter' is given the lines of every documentation block before
+it is converted.  It looks at the tags only (in the `<Tag>' or `@tag:'
+markup), not at the text, so that the blocks left out cost next to
+nothing.  A block is selected if it matches every kind of condition
+given, and a kind of condition if one of its patterns matches:
+
+  sections    the block is in a section with one of these names: it is
+              a `section' block with that name, or comes after one in
+              the same file
+  symbols     its symbol, the first line of its first tag, is one of
+              these (e.g. `FT_Init_FreeType')
+  tags        it has one of these tags (e.g. `struct'); the case of
+              tags doesn't matter
+
+Patterns may contain the wildcards of `fnmatch', as in `FT_Get_*'.
+
+Typical usage:
+    selected = blockfilter.BlockFilter( sections = ["gzip"] )
+    for block in blocks:
+        if selected.match( block.lines ):
+            ...
+    selected.reset()                # at the start of the next file
+'''
+from __future__ import print_function
+import fnmatch
+import export
+
+
+class BlockFilter:
+    '''Condition on the documentation blocks to convert'''
+
+    def __init__( self, sections = None, symbols = None, tags = None ):
+        self.sections = sections or []
+        self.symbols  = symbols or []
+        self.tags     = [tag.lower() for tag in tags or []]
+        self.section  = None        # the section of the current file
+
+    def reset( self ):
+        '''Forget the section; call this at the start of every file.'''
+        self.section = None
+
+    def match( self, lines ):
+        '''Tell whether the block given by its lines is selected.'''
+        tags, symbol, section = scan( lines )
+        if section:
+            self.section = section
+        return ( matches( self.section, self.sections )
+                 and matches( symbol, self.symbols )
+                 and ( not self.tags
+                       or any( matches( tag, self.tags ) for tag in tags ) ) )
+
+
+def matches( name, patterns ):
+    '''Tell whether `name' matches one of `patterns', or there are none.'''
+    if not patterns:
+        return True
+    if name is None:
+        return False
+    return any( fnmatch.fnmatchcase( name, pattern ) for pattern in patterns )
+
+
+def scan( lines ):
+    '''Return the tag names of a block, its symbol and the name of the
+    section it starts (or None).'''
+    tags    = []
+    symbol  = None
+    section = None
+    want    = None      # the tag whose first line comes next
+    for line in export.unbox( lines ):
+        match = export.re_tag.match( line )
+        if match:
+            tag = ( match.group( 1 ) or match.group( 2 ) ).lower()
+            tags.append( tag )
+            want = tag if len( tags ) == 1 or tag == "section" else None
+            line = match.group( 3 )
+        if want and line.strip():
+            if want == "section":
+                section = line.strip()
+            elif len( tags ) == 1:
+                symbol = line.strip()
+            want = None
+    return tags, symbol, section
+
+# eof
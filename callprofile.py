@@ -0,0 +1,151 @@
+#
+#  callprofile.py
+#
+#    Call profiles of the conversion, merged across workers (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Profile the conversion with `cProfile' and write the result as a
+`.pstats' file and as collapsed stacks.
+
+`CallProfile' is a listener for the stages of `instrument.py'.  The
+profiler runs while an outermost stage runs (a file being converted, or
+written), so the time a worker waits for work is left out.  Workers send
+their statistics to the parent, which adds them up.
+
+cProfile only records caller and callee pairs, not whole stacks.  The
+collapsed stacks are rebuilt from these pairs: the time of a function
+called from several places is split in proportion to the time spent in
+each call.  The result is exact for call trees and a good estimate
+otherwise; the `.pstats' file has the exact numbers.
+
+Typical usage:
+    profile = callprofile.CallProfile()
+    instrument.listeners.append( profile )
+    ...
+    profile.write( "run" )          # writes run.pstats and run.folded
+'''
+from __future__ import print_function
+import cProfile, pstats, os
+
+
+# Stacks with less than this many microseconds are dropped from the
+# collapsed output
+#
+min_time = 1
+
+
+class Raw:
+    '''Statistics in the form of `pstats', as needed by `pstats.Stats'.'''
+
+    def __init__( self, stats ):
+        self.stats = stats
+
+    def create_stats( self ):
+        pass
+
+
+class CallProfile:
+    '''Listener running `cProfile' during the outermost stages'''
+
+    key = "profile"
+
+    def __init__( self ):
+        self.depth   = 0
+        self.profile = cProfile.Profile()
+        self.stats   = None         # merged `pstats.Stats'
+
+    def enter( self, name, detail ):
+        self.depth += 1
+        if self.depth == 1:
+            self.profile.enable()
+
+    def leave( self, name, detail ):
+        self.depth -= 1
+        if self.depth == 0:
+            self.profile.disable()
+
+    def take( self ):
+        self.profile.create_stats()
+        stats        = self.profile.stats
+        self.profile = cProfile.Profile()
+        return stats
+
+    def merge( self, stats ):
+        if not stats:
+            return
+        if self.stats is None:
+            self.stats = pstats.Stats( Raw( stats ) )
+        else:
+            self.stats.add( Raw( stats ) )
+
+    def write( self, output ):
+        '''Write `OUTPUT.pstats' and `OUTPUT.folded'.'''
+        if output.endswith( ".pstats" ):
+            output = output[:-len( ".pstats" )]
+
+        self.merge( self.take() )
+        if self.stats is None:
+            self.stats = pstats.Stats( Raw( {} ) )
+        self.stats.dump_stats( output + ".pstats" )
+        with open( output + ".folded", "w" ) as f:
+            for stack, time in sorted( collapse( self.stats.stats ).items() ):
+                f.write( "%s %d\n" % ( stack, time ) )
+
+
+def label( function ):
+    '''Name a `( filename, line, name )' entry of the statistics.'''
+    filename, line, name = function
+    if filename == "~":
+        # a built-in function
+        return name
+    return "%s:%d:%s" % ( os.path.basename( filename ), line, name )
+
+
+def collapse( stats ):
+    '''Return a dictionary mapping `root;caller;...;function' stacks to
+    the microseconds spent in the last function, from `pstats' data.'''
+    callees = {}
+    for function, ( cc, nc, tt, ct, callers ) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault( caller, [] ).append( ( function, edge ) )
+
+    result = {}
+
+    def  visit( function, stack, own, scale ):
+        # `own' is the time spent in `function' itself on this stack,
+        # `scale' the part of its callees' time that belongs to it
+        stack = stack + [label( function )]
+        time  = int( own * 1000000 )
+        if time >= min_time:
+            key         = ";".join( stack )
+            result[key] = result.get( key, 0 ) + time
+
+        for callee, edge in callees.get( function, [] ):
+            if label( callee ) in stack:
+                # a recursive call; its time is already counted above
+                continue
+            total = stats[callee][3]
+            if total <= 0 or edge[3] * scale * 1000000 < min_time:
+                continue
+            visit( callee, stack, edge[2] * scale,
+                   scale * edge[3] / total )
+
+    # calls from outside the profiled code have no caller; what is left
+    # after the calls from known callers becomes the root of a stack
+    for function, ( cc, nc, tt, ct, callers ) in stats.items():
+        own   = tt - sum( edge[2] for edge in callers.values() )
+        total = ct - sum( edge[3] for edge in callers.values() )
+        if ct > 0 and total * 1000000 >= min_time:
+            visit( function, [], max( own, 0 ), total / ct )
+
+    return result
+
+# eof
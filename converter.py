@@ -57,6 +57,7 @@ start = r'''
 '''
 
 column = r'''
+  (?<!\s)  # (not inside white space, see `old_markup_tag')
   \s*      # any number of whitespace
   /\*{1}   # followed by '/' and precisely one asterisk
   ([^*].*) # followed by anything (group 1)
@@ -88,6 +89,7 @@ start = r'''
 '''
 
 column = r'''
+  (?<!\s)       # (not inside white space, see `old_markup_tag')
   \s*           # any number of whitespace
   \*{1}(?![*/]) # followed by precisely one asterisk not followed by `/'
   (.*)          # then anything (group1)
@@ -102,8 +104,15 @@ re_source_new_format = DocBlockFormat( 2, start, column, end )
 
 
 # old_markup_tag requires spaces after tag
-old_markup_tag = re.compile( r'''\s+<((?:\w|-)*)>\s*$''' )  # <xxxx> format
-new_markup_tag = re.compile( r'''\s*@((?:\w|-)*):''' )  # @xxxx: format
+#
+# These patterns, and the `column' patterns above, are searched for and
+# start with white space.  A search would try them from every position in
+# a long run of white space, each time to the end of the run; but when
+# they match, they also match from the start of the run.  So they are not
+# tried after white space.
+#
+old_markup_tag = re.compile( r'''(?<!\s)\s+<((?:\w|-)*)>\s*$''' )  # <xxxx> format
+new_markup_tag = re.compile( r'''(?<!\s)\s*@((?:\w|-)*):''' )  # @xxxx: format
 
 # this one is used while replacing the tag
 old_markup_tag_replace = re.compile( r'''<((?:\w|-)*)>''' )  # <xxxx> format
@@ -123,6 +132,68 @@ re_source_endline = re.compile(r'\*\/')    # */
 
 re_source_define_line = re.compile( r'\/\*\s*#(?:.*)\*\/' ) # /* #define FOO_BAR */
 
+
+def search_old_column( line ):
+    """Search `line' for a column of the old format.  Such a column ends
+    the line, so other lines are not searched: the search would go
+    through the rest of the line from every `/*' in it."""
+    if not line.rstrip().endswith( "*/" ):
+        return None
+    return re_source_old_format.column.search( line )
+
+
+def classify( lines ):
+    """Tell whether `Converter.convert' would return a block unchanged,
+    without converting it.  Returns the reason, or None if the block
+    must be converted.
+
+      'special'  The start line comes again before any column line, so
+                 the block is retained as it is.
+      'define'   The same, with only commented #define lines before it
+                 (or no column lines other than those).
+      'format2'  A block in the new format that has no old markup tags,
+                 no commented #define lines, no trailing spaces and no
+                 `/*' or `*/' in its column lines.
+    """
+    new_format = re_source_new_format.start.match( lines[0] )
+    if not new_format and not re_source_old_format.start.match( lines[0] ):
+        return None
+
+    newlinechar = lines[0][-1]
+    started     = False
+    defines     = False
+    unchanged   = new_format
+    for line in lines[1:]:
+        if re_source_old_format.start.match( line ):
+            if not started:
+                return "define" if defines else "special"
+            unchanged = False
+        if re_source_define_line.match( line ):
+            defines   = True
+            unchanged = False
+            continue
+        if ( search_old_column( line )
+             or re_source_new_format.column.search( line ) ):
+            started = True
+            if ( "/*" in line or "*/" in line
+                 or line.rstrip() + newlinechar != line ):
+                unchanged = False
+        if unchanged and re.search( old_markup_tag, line ):
+            unchanged = False
+
+    if not started:
+        return "define" if defines else "special"
+    if unchanged:
+        return "format2"
+    return None
+
+
+def classify_file( text ):
+    """Whole files are not classified; C comments outside documentation
+    blocks make a cheap test on the file text too strict to pay off."""
+    return None
+
+
 class Converter:
 
     def __init__(self):
@@ -247,7 +318,7 @@ class Converter:
                 # Otherwise return line as it is
                 return
 
-            m = re.search(re_source_old_format.column, self.line)
+            m = search_old_column( self.line )
             n = re.search(re_source_new_format.column, self.line)
             if m or n:
                 # If the line is a documentation line
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+#
+#  difftest.py
+#
+#    Differential test harness for conversion engines.
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+"""
+Feed the same comment blocks to a reference engine and a candidate engine
+and report the first line where their output differs.
+
+Blocks are taken from the given header files (split exactly as
+`SourceProcessor' splits them) and from randomly generated blocks, see
+`workload.mutated_block'.  A differing block is minimized by removing
+lines while the difference persists, so that the report shows a small
+input that reproduces it.
+
+An engine is any class with a `convert( lines )' method.  It is named
+either by one of the keys of `engines' or as `module:Class'.
+
+With `-j', the given files are also converted by both command line tools
+with worker processes, every file named twice, and the output must be
+that of a sequential run.
+
+The given files are also exported with `--export', once with and once
+without `--only-tag=function'; the records of the selected functions
+must have the same sections, as a filter only limits the conversion.
+"""
+from __future__ import print_function
+
+import converter, markdown, sources, utils, workload
+import markdown_utils as mdutils
+
+import sys, os, getopt, functools, importlib, json, random, shutil
+import subprocess, tempfile, traceback
+
+
+# known engines, by name
+#
+engines = { "converter"     : converter.Converter,
+            "markify"       : markdown.Markify,
+            "markify-blocks": functools.partial( markdown.Markify,
+                                                 block_tables = True ) }
+
+# number of random blocks
+#
+random_count = 1000
+seed         = 1
+
+
+def  usage():
+    print( "\nDiffTest Usage information\n" )
+    print( "  difftest [options] [file1 ...]\n" )
+    print( "using the following options:\n" )
+    print( "  -h : print this page" )
+    print( "  -r : reference engine, as in '-r markify' (default converter)" )
+    print( "  -c : candidate engine, as in '-c mymodule:FastMarkify'" )
+    print( "  -n : number of random blocks (default 1000)" )
+    print( "  -s : random seed (default 1)" )
+    print( "  -j : also compare the tools run with N worker processes" )
+    print( "" )
+    print( "  --reference=ENGINE, --candidate=ENGINE, --count=N," )
+    print( "  --seed=N, --jobs=N : long forms of the above" )
+    print( "" )
+    print( "  known engines: " + ", ".join( sorted( engines ) ) )
+
+
+def  find_engine( name ):
+    """Return the engine class called `name'."""
+    if name in engines:
+        return engines[name]
+    if ":" not in name:
+        raise ValueError( "unknown engine '" + name + "'" )
+    module, cls = name.split( ":", 1 )
+    return getattr( importlib.import_module( module ), cls )
+
+
+################################################################
+##
+##  BLOCK COLLECTION
+##
+
+class  Recorder:
+    """An engine that records the blocks it is given and returns them
+       unchanged.  Used to split files the way `SourceProcessor' does."""
+
+    def  __init__( self ):
+        self.blocks = []
+
+    def  convert( self, lines ):
+        self.blocks.append( lines[:] )
+        return lines
+
+
+def  file_blocks( filename ):
+    """Return `( origin, lines )' for each documentation block of a file."""
+    processor           = sources.SourceProcessor()
+    recorder            = Recorder()
+    processor.converter = recorder
+    processor.parse_file( filename )
+    return [ ( filename + " block " + str( i + 1 ), lines )
+             for i, lines in enumerate( recorder.blocks ) ]
+
+
+def  random_blocks( count, seed ):
+    rng = random.Random( seed )
+    return [ ( "random block " + str( i + 1 ) + " (seed "
+               + str( seed ) + ")", workload.mutated_block( rng ) )
+             for i in range( count ) ]
+
+
+################################################################
+##
+##  COMPARISON
+##
+
+def  run( engine, lines ):
+    """Convert a copy of `lines'.  An exception is part of the output,
+       so that two engines failing the same way still compare equal."""
+    try:
+        return list( engine.convert( lines[:] ) )
+    except Exception:
+        return [ "<exception>\n",
+                 traceback.format_exception_only( *sys.exc_info()[:2] )[-1] ]
+
+
+def  run_all( cls, blocks ):
+    """Convert all blocks in order with a single fresh engine, just like
+       `SourceProcessor' does for a file."""
+    mdutils.reset()
+    engine = cls()
+    return [ run( engine, lines ) for origin, lines in blocks ]
+
+
+def  first_difference( a, b ):
+    """Return the index of the first differing line, or -1."""
+    for i in range( max( len( a ), len( b ) ) ):
+        if i >= len( a ) or i >= len( b ) or a[i] != b[i]:
+            return i
+    return -1
+
+
+def  differs( reference, candidate, lines ):
+    """Check whether a single block, converted by fresh engines, gives
+       different results."""
+    mdutils.reset()
+    a = run( reference(), lines )
+    mdutils.reset()
+    b = run( candidate(), lines )
+    return a != b
+
+
+def  minimize( lines, predicate ):
+    """Delta debugging: remove chunks of lines as long as `predicate'
+       still holds for the rest."""
+    n = 2
+    while len( lines ) >= 2:
+        chunk   = max( 1, len( lines ) // n )
+        reduced = False
+        for start in range( 0, len( lines ), chunk ):
+            rest = lines[:start] + lines[start + chunk:]
+            if rest and predicate( rest ):
+                lines   = rest
+                n       = max( n - 1, 2 )
+                reduced = True
+                break
+        if not reduced:
+            if chunk == 1:
+                break
+            n = min( n * 2, len( lines ) )
+    return lines
+
+
+def  report( origin, lines, ref_out, cand_out, reference, candidate ):
+    index = first_difference( ref_out, cand_out )
+
+    def  show( out ):
+        return repr( out[index] ) if index < len( out ) else "<end of block>"
+
+    print( "difference in " + origin + ", output line " + str( index + 1 ) )
+    print( "  reference: " + show( ref_out ) )
+    print( "  candidate: " + show( cand_out ) )
+
+    predicate = lambda l: differs( reference, candidate, l )
+    if predicate( lines ):
+        small = minimize( lines, predicate )
+        print( "minimized input (" + str( len( small ) ) + " of "
+               + str( len( lines ) ) + " lines):" )
+    else:
+        # the difference depends on state left by earlier blocks
+        small = lines
+        print( "input (depends on preceding blocks, not minimized):" )
+    for line in small:
+        print( "  | " + line, end = "" if line.endswith( "\n" ) else "\n" )
+
+
+def  compare_jobs( file_list, jobs ):
+    """Convert `file_list', every file named twice, with each tool
+       sequentially, then with `jobs' worker processes (with and without
+       `-k').  Returns a list of failure messages."""
+    here     = os.path.dirname( os.path.abspath( __file__ ) )
+    failures = []
+    for tool in ( "docconverter.py", "markify.py" ):
+        command   = [sys.executable, os.path.join( here, tool )]
+        reference = subprocess.check_output( command + file_list
+                                             + file_list )
+        for options in ( ["-j", str( jobs )], ["-j", str( jobs ), "-k"] ):
+            run = subprocess.Popen( command + options + file_list
+                                    + file_list,
+                                    stdout = subprocess.PIPE,
+                                    stderr = subprocess.PIPE )
+            output, errors = run.communicate()
+            if run.returncode or output != reference:
+                failures.append( "%s %s: %d of %d bytes, exit status %d"
+                                 % ( tool, " ".join( options ),
+                                     len( output ), len( reference ),
+                                     run.returncode ) )
+    return failures
+
+
+def  compare_export( file_list ):
+    """Export `file_list' with each tool, with and without a block
+       filter, and compare the sections of the selected functions.
+       Returns a list of failure messages and the number of records
+       compared."""
+    here     = os.path.dirname( os.path.abspath( __file__ ) )
+    tmpdir   = tempfile.mkdtemp( prefix = "ftdocs-difftest-" )
+    failures = []
+    total    = 0
+
+    def  export( command, options ):
+        filename = os.path.join( tmpdir, "blocks.jsonl" )
+        subprocess.check_call( command + ["--export=" + filename]
+                               + options + file_list,
+                               stdout = subprocess.DEVNULL )
+        with open( filename ) as f:
+            return dict( ( ( r["file"], r["symbol"] ), r["section"] )
+                         for r in map( json.loads, f )
+                         if r["kind"] == "function" )
+
+    try:
+        for tool in ( "docconverter.py", "markify.py" ):
+            command  = [sys.executable, os.path.join( here, tool )]
+            all      = export( command, [] )
+            filtered = export( command, ["--only-tag=function"] )
+            for key in sorted( set( all ) & set( filtered ), key = str ):
+                total += 1
+                if filtered[key] != all[key]:
+                    failures.append( "%s --only-tag=function: %s in %s "
+                                     "has section %s, without the filter %s"
+                                     % ( tool, key[1], key[0],
+                                         filtered[key], all[key] ) )
+                    break
+    finally:
+        shutil.rmtree( tmpdir, True )
+    return failures, total
+
+
+def  main( argv ):
+    """Main program loop."""
+
+    global random_count, seed
+
+    try:
+        opts, args = getopt.getopt( sys.argv[1:],
+                                    "hr:c:n:s:j:",
+                                    ["help", "reference=", "candidate=",
+                                     "count=", "seed=", "jobs="] )
+    except getopt.GetoptError:
+        usage()
+        sys.exit( 2 )
+
+    reference = "converter"
+    candidate = None
+    jobs      = 0
+
+    try:
+        for opt in opts:
+            if opt[0] in ( "-h", "--help" ):
+                usage()
+                sys.exit( 0 )
+
+            if opt[0] in ( "-r", "--reference" ):
+                reference = opt[1]
+
+            if opt[0] in ( "-c", "--candidate" ):
+                candidate = opt[1]
+
+            if opt[0] in ( "-n", "--count" ):
+                random_count = int( opt[1] )
+
+            if opt[0] in ( "-s", "--seed" ):
+                seed = int( opt[1] )
+
+            if opt[0] in ( "-j", "--jobs" ):
+                jobs = int( opt[1] )
+
+        reference = find_engine( reference )
+        candidate = find_engine( candidate ) if candidate else reference
+    except ( ValueError, ImportError, AttributeError ) as e:
+        sys.stderr.write( str( e ) + "\n" )
+        usage()
+        sys.exit( 2 )
+
+    # each corpus file is run separately, so that state carried from one
+    # block to the next is compared too
+    groups    = []
+    file_list = utils.make_file_list( args ) if args else None
+    for filename in file_list or []:
+        groups.append( file_blocks( filename ) )
+    groups.append( random_blocks( random_count, seed ) )
+
+    total = 0
+    for blocks in groups:
+        ref_outs  = run_all( reference, blocks )
+        cand_outs = run_all( candidate, blocks )
+        for ( origin, lines ), a, b in zip( blocks, ref_outs, cand_outs ):
+            total += 1
+            if a != b:
+                report( origin, lines, a, b, reference, candidate )
+                sys.exit( 1 )
+
+    print( str( total ) + " blocks, no differences" )
+
+    if file_list:
+        failed, records = compare_export( file_list )
+        for message in failed:
+            print( message )
+        if failed:
+            sys.exit( 1 )
+        print( str( records ) + " records, same sections with a filter" )
+
+    if jobs and file_list:
+        failed = compare_jobs( file_list, jobs )
+        for message in failed:
+            print( message )
+        if failed:
+            sys.exit( 1 )
+        print( str( len( file_list ) ) + " files, same output with "
+               + str( jobs ) + " jobs" )
+
+
+# if called from the command line
+if __name__ == '__main__':
+    main( sys.argv )
+
+# eof
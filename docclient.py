@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+#
+#  docclient.py
+#
+#    Convert files with a running `docserver.py'.
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+
+# This script is meant to start fast: it only imports modules that
+# Python loads anyway, and leaves all the work to the server.
+
+import sys, os, getopt, json, socket, tempfile
+
+
+def  usage():
+    print( "\nDocClient Usage information\n" )
+    print( "  docclient [options] file1 [file2 ...]\n" )
+    print( "  docclient [options] - < file.h > output.h\n" )
+    print( "using the following options:\n" )
+    print( "  -h : print this page" )
+    print( "  -s : socket of the server, as in '-s /tmp/docs.sock'" )
+    print( "  -m : conversion, 'markify' (the default) or 'docconverter'" )
+    print( "  -t : print the time taken for every file to stderr" )
+    print( "" )
+    print( "  --socket : same as -s, as in '--socket=/tmp/docs.sock'" )
+    print( "  --mode : same as -m, as in '--mode=docconverter'" )
+    print( "  --timing : same as -t" )
+
+
+def  default_socket():
+    """Return the socket path used when none is given."""
+    directory = os.environ.get( "XDG_RUNTIME_DIR" ) or tempfile.gettempdir()
+    return os.path.join( directory, "freetype-docs-%d.sock" % os.getuid() )
+
+
+def  send_message( sock, message ):
+    """Send a message; messages are JSON documents on a single line."""
+    sock.sendall( ( json.dumps( message ) + "\n" ).encode( "utf-8" ) )
+
+
+def  read_message( stream ):
+    """Read a message from a file object; returns None at the end."""
+    line = stream.readline()
+    if not line:
+        return None
+    return json.loads( line.decode( "utf-8" ) )
+
+
+def  request( socket_name, items, mode = "markify" ):
+    """Send one conversion request and return the server's answer."""
+    sock = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+    try:
+        sock.connect( socket_name )
+        send_message( sock, { "mode": mode, "items": items } )
+        with sock.makefile( "rb" ) as stream:
+            return read_message( stream )
+    finally:
+        sock.close()
+
+
+def  main( argv ):
+    """Main program loop."""
+
+    try:
+        opts, args = getopt.getopt( sys.argv[1:],
+                                    "hs:m:t",
+                                    ["help", "socket=", "mode=", "timing"] )
+    except getopt.GetoptError:
+        usage()
+        sys.exit( 2 )
+
+    if args == []:
+        usage()
+        sys.exit( 1 )
+
+    socket_name = default_socket()
+    mode        = "markify"
+    timing      = False
+
+    for opt in opts:
+        if opt[0] in ( "-h", "--help" ):
+            usage()
+            sys.exit( 0 )
+
+        if opt[0] in ( "-s", "--socket" ):
+            socket_name = opt[1]
+
+        if opt[0] in ( "-m", "--mode" ):
+            mode = opt[1]
+
+        if opt[0] in ( "-t", "--timing" ):
+            timing = True
+
+    # the server has its own working directory
+    items = []
+    for name in args:
+        if name == "-":
+            items.append( { "name": "-", "text": sys.stdin.read() } )
+        else:
+            items.append( { "path": os.path.abspath( name ) } )
+
+    try:
+        answer = request( socket_name, items, mode )
+    except ( IOError, OSError ) as e:
+        sys.stderr.write( "cannot reach the server at " + socket_name
+                          + ": " + str( e ) + "\n" )
+        sys.exit( 2 )
+
+    if answer is None or "error" in answer:
+        sys.stderr.write( ( answer or {} ).get( "error", "no answer" )
+                          + "\n" )
+        sys.exit( 2 )
+
+    failed = 0
+    for result in answer["results"]:
+        if result["error"]:
+            failed += 1
+            sys.stderr.write( "failed: " + result["name"] + "\n"
+                              + result["error"] )
+        else:
+            sys.stdout.write( result["text"] )
+        if timing:
+            sys.stderr.write( "%8.3fs  %s\n" % ( result["seconds"],
+                                                 result["name"] ) )
+    if timing:
+        sys.stderr.write( "%8.3fs  total on the server\n" % answer["seconds"] )
+
+    if failed:
+        sys.exit( 1 )
+
+
+# if called from the command line
+if __name__ == '__main__':
+    main( sys.argv )
+
+# eof
@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+#
+#  docserver.py
+#
+#    Serve conversions over a Unix socket from warm worker processes.
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+
+#
+# Editors and commit hooks that convert one file at a time spend most of
+# their time starting Python and compiling regular expressions.  This
+# server starts a pool of workers once (see `batch.Worker') and converts
+# files for `docclient.py', or any program speaking the protocol below.
+#
+# Every message is a JSON document on a single line.  A request is
+#
+#   { "mode" : "markify" or "docconverter",
+#     "items": [ { "path": "/abs/file.h" },
+#                { "name": "buffer", "text": "C source ..." }, ... ] }
+#
+# and the answer, once all items are converted,
+#
+#   { "results": [ { "name": ..., "text": ..., "error": ...,
+#                    "seconds": ... }, ... ],
+#     "seconds": ... }
+#
+# in the order of the items; `error' is None or a traceback.  A request
+# that cannot be understood gets `{ "error": "message" }'.  A connection
+# can carry any number of requests, one after another.
+#
+
+import utils, batch, docclient
+
+import sys, os, getopt, time, signal, socket, socketserver, threading
+import queue, traceback
+import multiprocessing.connection
+
+
+modes = { "docconverter": 1, "markify": 2 }
+
+
+def  usage():
+    print( "\nDocServer Usage information\n" )
+    print( "  docserver [options]\n" )
+    print( "using the following options:\n" )
+    print( "  -h : print this page" )
+    print( "  -s : socket to listen on, as in '-s /tmp/docs.sock'" )
+    print( "  -j : number of worker processes per mode, as in '-j 4'" )
+    print( "  -b : lay out Markdown field tables per block" )
+    print( "" )
+    print( "  --socket : same as -s, as in '--socket=/tmp/docs.sock'" )
+    print( "  --jobs : same as -j, as in '--jobs=4'" )
+    print( "  --timeout : seconds after which a file counts as failed," )
+    print( "              as in '--timeout=60'" )
+    print( "  --block-tables : same as -b" )
+
+
+class  Pool:
+    """Workers of both modes, started once and shared by all requests."""
+
+    def  __init__( self, jobs ):
+        self.jobs  = jobs
+        self.lock  = threading.Lock()
+        self.idle  = dict( ( type, queue.Queue() ) for type in modes.values() )
+        self.count = dict( ( type, 0 ) for type in modes.values() )
+
+    def  start( self ):
+        for type in modes.values():
+            for i in range( self.jobs ):
+                self.release( type, self.new_worker( type ) )
+
+    def  new_worker( self, type ):
+        with self.lock:
+            self.count[type] += 1
+        return batch.Worker( type )
+
+    def  acquire( self, type, block ):
+        """Return an idle worker.  Without `block', return None if there
+           is none."""
+        with self.lock:
+            missing = self.count[type] < self.jobs
+        if missing:
+            return self.new_worker( type )
+        try:
+            return self.idle[type].get( block )
+        except queue.Empty:
+            return None
+
+    def  release( self, type, worker ):
+        self.idle[type].put( worker )
+
+    def  discard( self, type, worker ):
+        """Kill a worker that is stuck or dead; a new one replaces it when
+           needed."""
+        worker.kill()
+        with self.lock:
+            self.count[type] -= 1
+
+    def  stop( self ):
+        for type in modes.values():
+            while True:
+                try:
+                    self.idle[type].get_nowait().stop()
+                except queue.Empty:
+                    break
+
+
+def  convert( pool, message ):
+    """Answer a conversion request."""
+    begin = time.time()
+    if message.get( "mode", "markify" ) not in modes:
+        return { "error": "unknown mode '" + str( message["mode"] ) + "'" }
+    type = modes[message.get( "mode", "markify" )]
+
+    if not isinstance( message.get( "items", [] ), list ):
+        return { "error": "'items' must be a list" }
+
+    items = []
+    for entry in message.get( "items", [] ):
+        if not isinstance( entry, dict ):
+            return { "error": "an item must be an object" }
+        if isinstance( entry.get( "path" ), str ):
+            items.append( entry["path"] )
+        elif ( isinstance( entry.get( "text" ), str )
+               and isinstance( entry.get( "name", "-" ), str ) ):
+            items.append( ( entry.get( "name", "-" ), entry["text"] ) )
+        else:
+            return { "error": "an item needs a 'path' or a 'text' string" }
+
+    # take one worker, waiting if necessary, and any other idle ones
+    results = [None] * len( items )
+    todo    = list( range( len( items ) ) )
+    busy    = {}            # connection -> [worker, indices, start]
+    while todo or busy:
+        while todo:
+            worker = pool.acquire( type, not busy )
+            if worker is None:
+                break
+            # split what is left among the workers we may still get
+            share = max( 1, pool.jobs - len( busy ) )
+            count = ( len( todo ) + share - 1 ) // share
+            mine, todo = todo[:count], todo[count:]
+            worker.send( [items[i] for i in mine] )
+            busy[worker.conn] = [worker, mine, time.time()]
+
+        first = min( start for worker, mine, start in busy.values() )
+        ready = multiprocessing.connection.wait(
+                  list( busy ), max( 0, first + utils.timeout - time.time() ) )
+        now   = time.time()
+        for conn in list( busy ):
+            worker, mine, start = busy[conn]
+            if conn in ready:
+                try:
+                    name, text, error, data = worker.receive()
+                except ( EOFError, IOError, OSError ):
+                    name, text, error = None, None, "worker process died\n"
+            elif now - start >= utils.timeout:
+                name, text = None, None
+                error = ( "timed out after " + str( utils.timeout )
+                          + " seconds\n" )
+            else:
+                continue
+
+            index = mine.pop( 0 )
+            if name is None:
+                # the worker is gone; the rest goes to another one
+                name = items[index]
+                name = name[0] if isinstance( name, tuple ) else name
+                pool.discard( type, worker )
+                del busy[conn]
+                todo = mine + todo
+            elif not mine:
+                pool.release( type, worker )
+                del busy[conn]
+            else:
+                busy[conn][2] = now
+
+            results[index] = { "name": name, "text": text, "error": error,
+                               "seconds": round( now - start, 6 ) }
+
+    return { "results": results, "seconds": round( time.time() - begin, 6 ) }
+
+
+class  Handler( socketserver.StreamRequestHandler ):
+
+    def  handle( self ):
+        while True:
+            try:
+                message = docclient.read_message( self.rfile )
+            except ValueError as e:
+                message = e
+            if message is None:
+                break
+            if isinstance( message, dict ):
+                try:
+                    answer = convert( self.server.pool, message )
+                except Exception:
+                    # answer instead of dropping the connection
+                    answer = { "error": "request failed:\n"
+                                        + traceback.format_exc() }
+            else:
+                answer = { "error": "invalid request: " + str( message ) }
+            docclient.send_message( self.connection, answer )
+
+
+class  Server( socketserver.ThreadingMixIn, socketserver.UnixStreamServer ):
+    daemon_threads = True
+
+
+def  main( argv ):
+    """Main program loop."""
+
+    try:
+        opts, args = getopt.getopt( sys.argv[1:],
+                                    "hs:j:b",
+                                    ["help", "socket=", "jobs=", "timeout=",
+                                     "block-tables"] )
+    except getopt.GetoptError:
+        usage()
+        sys.exit( 2 )
+
+    socket_name = docclient.default_socket()
+    jobs        = 2
+
+    for opt in opts:
+        if opt[0] in ( "-h", "--help" ):
+            usage()
+            sys.exit( 0 )
+
+        if opt[0] in ( "-s", "--socket" ):
+            socket_name = opt[1]
+
+        if opt[0] in ( "-j", "--jobs" ):
+            try:
+                jobs = int( opt[1] )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] == "--timeout":
+            try:
+                utils.timeout = float( opt[1] )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] in ( "-b", "--block-tables" ):
+            utils.block_tables = True
+
+    # a socket file left behind by a server that died is removed; one
+    # that answers belongs to a running server
+    if os.path.exists( socket_name ):
+        probe = socket.socket( socket.AF_UNIX, socket.SOCK_STREAM )
+        try:
+            probe.connect( socket_name )
+            sys.stderr.write( "a server is already listening on "
+                              + socket_name + "\n" )
+            sys.exit( 1 )
+        except ( IOError, OSError ):
+            os.unlink( socket_name )
+        finally:
+            probe.close()
+
+    pool = Pool( max( 1, jobs ) )
+    pool.start()
+
+    server = Server( socket_name, Handler )
+    server.pool = pool
+    sys.stderr.write( "listening on " + socket_name + "\n" )
+    signal.signal( signal.SIGTERM, lambda number, frame: sys.exit( 0 ) )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink( socket_name )
+        pool.stop()
+
+
+# if called from the command line
+if __name__ == '__main__':
+    main( sys.argv )
+
+# eof
@@ -0,0 +1,231 @@
+#
+#  export.py
+#
+#    Structured records of the documentation blocks (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Record every documentation block as the conversion writes it, so that
+tools reading the documentation don't have to parse the headers again.
+
+`Exporter' is a listener for the stages of `instrument.py' that ignores
+the stages themselves; it only uses `take' and `merge' to collect the
+records of the workers in the parent.  `SourceProcessor' calls `block'
+with the output lines of every documentation block it converts or
+passes through, and `write' stores one JSON record per line:
+
+    { "file"   : "include/freetype/freetype.h",
+      "line"   : 120,
+      "section": "base_interface",
+      "symbol" : "FT_Init_FreeType",
+      "kind"   : "function",
+      "tags"   : { "function": "FT_Init_FreeType", "description": ...,
+                   "output": ... },
+      "fields" : [ { "tag": "output", "name": "alibrary",
+                     "text": "A handle to a new library object." } ],
+      "code"   : [ { "tag": "note", "text": "FT_Done_FreeType( lib );" } ] }
+
+Both markups are understood, `@tag:' of Markify and `<Tag>' of
+DocConverter.  `symbol' is the first line of the first tag, `kind' its
+name, and `section' the name given by the last `section' tag of the file
+before the block.  Tag texts are unboxed and dedented; code sequences
+(in braces or fenced by "```") and field lists stay in them and are also
+listed on their own.
+
+Typical usage:
+    exporter = export.Exporter()
+    instrument.listeners.append( exporter )
+    ...
+    exporter.write( "blocks.jsonl" )
+'''
+from __future__ import print_function
+import json, re
+
+
+# The content of a line of a documentation block, for both block formats
+#
+re_column = re.compile( r'''
+  \s* (?: /\* (?!\*) (.*?) \*/ \s* $   # `/* content */' (group 1)
+        | \* (?![*/]) (.*) )           # or `* content' (group 2)
+''', re.VERBOSE )
+
+# A tag line, `@tag: text' or `<Tag> text'
+#
+re_tag = re.compile( r'''
+  \s* (?: @ ( [\w-]+ ) : | < ( [\w-]+ ) > ) [ \t]* (.*)
+''', re.VERBOSE )
+
+# A field line, `name ::' maybe followed by text
+#
+re_field = re.compile( r'''
+  ( \s* ) ( \w (?: [\w.]* \w )? ) \s* :: [ \t]* (.*)
+''', re.VERBOSE )
+
+# The start and the end of a code sequence
+#
+re_code_start = re.compile( r"(\s*)(?:{|```)\s*$" )
+re_code_end   = re.compile( r"(\s*)(?:}|```)\s*$" )
+
+
+class Exporter:
+    '''Listener collecting a record of every documentation block'''
+
+    key = "export"
+
+    def __init__( self ):
+        self.records = []
+
+    def enter( self, name, detail ):
+        pass
+
+    def leave( self, name, detail ):
+        pass
+
+    def block( self, filename, lineno, lines ):
+        '''Add the record of a block at line `lineno' of `filename'; blocks
+        without tags are left out.'''
+        record = parse( lines )
+        if record:
+            record["file"] = filename
+            record["line"] = lineno
+            self.records.append( record )
+
+    def take( self ):
+        records      = self.records
+        self.records = []
+        return records
+
+    def merge( self, records ):
+        self.records.extend( records )
+
+    def write( self, filename ):
+        '''Write all records to `filename', in the order of the files and
+        lines, after setting their sections.'''
+        self.records.sort( key = lambda r: ( r["file"], r["line"] ) )
+        with open( filename, "w" ) as f:
+            last, section = None, None
+            for record in self.records:
+                if record["file"] != last:
+                    last, section = record["file"], None
+                if "section" in record["tags"]:
+                    section = first_line( record["tags"]["section"] )
+                record["section"] = section
+                f.write( json.dumps( record, sort_keys = True ) + "\n" )
+
+
+def unbox( lines ):
+    '''Return the content of the column lines of a block, without the
+    decoration lines.  An entry of `lines' may hold several lines.'''
+    content = []
+    for line in "".join( lines ).split( "\n" ):
+        match = re_column.match( line.rstrip( "\r" ) )
+        if match:
+            text = match.group( 1 )
+            if text is None:
+                text = match.group( 2 )
+            content.append( text.rstrip() )
+    return content
+
+
+def dedent( lines ):
+    '''Remove the common indentation and the blank lines around `lines'
+    and join them.'''
+    while lines and not lines[-1]:
+        lines = lines[:-1]
+    while lines and not lines[0]:
+        lines = lines[1:]
+    indent = min( [len( line ) - len( line.lstrip() )
+                   for line in lines if line] or [0] )
+    return "\n".join( line[indent:] for line in lines )
+
+
+def join( first, lines ):
+    '''Join the text after a tag or field name with the lines after it,
+    which have an indentation of their own.'''
+    text = dedent( lines )
+    if first and text:
+        return first + "\n" + text
+    return first or text
+
+
+def first_line( text ):
+    return text.split( "\n", 1 )[0].strip() or None
+
+
+def parse( lines ):
+    '''Return the record of a block given by its lines, without `file',
+    `line' and `section', or None if it has no tags.'''
+    tags  = []      # [ name, first, lines ] of every tag
+    code  = None    # lines of the current code sequence
+    depth = None    # indentation of its start
+
+    record = { "tags": {}, "fields": [], "code": [] }
+    field  = None   # the record of the current field
+
+    for line in unbox( lines ):
+        if code is not None:
+            end = re_code_end.match( line )
+            if end and len( end.group( 1 ) ) == depth:
+                record["code"].append( { "tag" : tags[-1][0],
+                                         "text": dedent( code ) } )
+                code = None
+            else:
+                code.append( line )
+            tags[-1][2].append( line )
+            continue
+
+        match = re_tag.match( line )
+        if match:
+            name  = ( match.group( 1 ) or match.group( 2 ) ).lower()
+            tags.append( [name, match.group( 3 ), []] )
+            field = None
+            continue
+        if not tags:
+            continue
+        tags[-1][2].append( line )
+
+        start = re_code_start.match( line )
+        if start:
+            code, depth = [], len( start.group( 1 ) )
+            field = None
+            continue
+
+        match = re_field.match( line )
+        if match:
+            field = { "tag" : tags[-1][0], "name": match.group( 2 ),
+                      "indent": len( match.group( 1 ) ),
+                      "first": match.group( 3 ), "lines": [] }
+            record["fields"].append( field )
+        elif field and ( not line
+                         or len( line ) - len( line.lstrip() )
+                            > field["indent"] ):
+            field["lines"].append( line )
+        else:
+            field = None
+
+    if not tags:
+        return None
+
+    for field in record["fields"]:
+        field["text"] = join( field.pop( "first" ), field.pop( "lines" ) )
+        del field["indent"]
+    for name, first, lines in tags:
+        text = join( first, lines )
+        if name in record["tags"]:
+            text = record["tags"][name] + "\n\n" + text
+        record["tags"][name] = text
+
+    record["kind"]   = tags[0][0]
+    record["symbol"] = None
+    if record["kind"] != "section":
+        record["symbol"] = first_line( record["tags"][record["kind"]] )
+    return record
+
+# eof
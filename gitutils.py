@@ -0,0 +1,159 @@
+#
+#  gitutils.py
+#
+#    Queries to the local git repository (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Helpers that ask git about the input files, or read them from a
+revision without checking it out.
+
+Typical usage:
+    import gitutils
+    file_list = gitutils.changed_since( file_list, "VER-2-9" )
+
+    blobs = gitutils.list_blobs( "VER-2-9", ["include/freetype"] )
+    data  = gitutils.read_blob( blobs["include/freetype/freetype.h"][0] )
+'''
+from __future__ import print_function
+import os, subprocess, fnmatch
+
+
+class GitError( Exception ):
+    '''Raised when a git command fails'''
+    pass
+
+
+def git( args, cwd = None ):
+    '''Run git with `args' and return its output as a string'''
+    try:
+        proc = subprocess.Popen( ["git"] + args, cwd = cwd,
+                                 stdout = subprocess.PIPE,
+                                 stderr = subprocess.PIPE )
+    except OSError as e:
+        raise GitError( "cannot run git: " + str( e ) )
+    out, err = proc.communicate()
+    if proc.returncode != 0:
+        raise GitError( "git " + " ".join( args ) + ": "
+                        + err.decode( "utf-8", "replace" ).strip() )
+    return out.decode( "utf-8", "surrogateescape" )
+
+
+def toplevel( directory ):
+    '''Return the root of the work tree containing `directory' '''
+    return git( ["rev-parse", "--show-toplevel"], directory ).strip()
+
+
+def changed_paths( top, rev ):
+    '''Return the set of real paths in work tree `top' that differ from
+    revision `rev'.  This covers committed, staged and unstaged changes,
+    the new name of renamed files, and untracked files.'''
+    out  = git( ["diff", "--name-only", "-z", "--find-renames", rev, "--"],
+                top )
+    out += git( ["ls-files", "--others", "--exclude-standard", "-z"], top )
+    return set( os.path.realpath( os.path.join( top, name ) )
+                for name in out.split( "\0" ) if name )
+
+
+def changed_since( file_list, rev ):
+    '''Return the files of `file_list' that changed since revision `rev'.
+    The files may belong to different repositories.'''
+    tops    = {}    # directory -> work tree root
+    changed = {}    # work tree root -> set of changed paths
+    result  = []
+
+    for filename in file_list:
+        directory = os.path.dirname( os.path.abspath( filename ) )
+        if directory not in tops:
+            tops[directory] = toplevel( directory )
+        top = tops[directory]
+        if top not in changed:
+            changed[top] = changed_paths( top, rev )
+        if os.path.realpath( filename ) in changed[top]:
+            result.append( filename )
+
+    return result
+
+
+def list_blobs( rev, paths ):
+    '''Return a dictionary mapping the files that `paths' name in
+    revision `rev' to `( blob, size )' tuples.  A path names a file, all
+    `.h' files below a directory, or the files matching a pattern with
+    `*'.  Paths are relative to the current directory, which must be in
+    the work tree, and so are the names returned.'''
+    entries = {}
+    for entry in git( ["ls-tree", "-r", "-l", "-z", rev] ).split( "\0" ):
+        if not entry:
+            continue
+        info, name       = entry.split( "\t", 1 )
+        mode, kind, blob, size = info.split()
+        if kind == "blob":
+            entries[name] = ( blob, int( size ) )
+
+    result = {}
+    for path in paths:
+        path = os.path.normpath( path )
+        if "*" in path:
+            names = [n for n in entries if fnmatch.fnmatchcase( n, path )]
+        elif path in entries:
+            names = [path]
+        else:
+            prefix = "" if path == "." else path + "/"
+            names  = [n for n in entries
+                      if n.startswith( prefix ) and n.endswith( ".h" )]
+        for name in names:
+            result[name] = entries[name]
+    return result
+
+
+class BlobReader:
+    '''A `git cat-file --batch' process that reads objects one after
+    another, without starting git for each of them'''
+
+    def __init__( self, cwd = None ):
+        try:
+            self.proc = subprocess.Popen( ["git", "cat-file", "--batch"],
+                                          cwd    = cwd,
+                                          stdin  = subprocess.PIPE,
+                                          stdout = subprocess.PIPE )
+        except OSError as e:
+            raise GitError( "cannot run git: " + str( e ) )
+        self.pid = os.getpid()
+
+    def read( self, name ):
+        '''Return the contents of object `name' (e.g. a blob hash) as
+        bytes.'''
+        self.proc.stdin.write( name.encode( "utf-8" ) + b"\n" )
+        self.proc.stdin.flush()
+        header = self.proc.stdout.readline().split()
+        if len( header ) != 3:
+            raise GitError( "git cat-file: no object '" + name + "'" )
+        data = self.proc.stdout.read( int( header[2] ) )
+        self.proc.stdout.read( 1 )      # the newline after the object
+        return data
+
+    def close( self ):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+
+reader = None   # the `BlobReader' of this process
+
+
+def read_blob( blob ):
+    '''Return the contents of a blob through the `BlobReader' of this
+    process, which is started on first use.'''
+    global reader
+    if reader is None or reader.pid != os.getpid():
+        # a forked process must not share the pipes of its parent
+        reader = BlobReader()
+    return reader.read( blob )
+
+# eof
@@ -0,0 +1,133 @@
+#
+#  instrument.py
+#
+#    Pipeline stages for profiling and tracing (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Mark the stages of the conversion pipeline, so that profilers can
+attribute time and memory to them.
+
+A stage is either a function decorated with `staged', or the body of a
+`with stage( name ):' statement.  Stages nest; a profiler sees every
+stage entered and left through the `listeners' list.  With no listener
+installed, a stage costs one extra function call.
+
+A listener is an object with these methods:
+
+    enter( name, detail )    a stage starts; `detail' is e.g. a file name
+    leave( name, detail )    the innermost stage ends
+    take()                   return the data collected since the last
+                             call, for a worker to send to its parent
+    merge( data )            add the data taken from a worker's listener
+
+and a `key' attribute that matches the listeners of a worker with those
+of its parent.
+
+Typical usage:
+    import instrument
+
+    @instrument.staged( "convert" )
+    def convert( lines ):
+        ...
+
+    with instrument.stage( "file", filename ):
+        ...
+'''
+from __future__ import print_function
+import functools
+
+
+# The active listeners, in the order they are called on `enter'
+#
+listeners = []
+
+# The code objects of all staged functions, mapped to their stage name
+#
+code_stages = {}
+
+# Named event counts, e.g. of blocks passed through unchanged; they are
+# always collected and travel from workers to their parent with `take'
+#
+counters = {}
+
+
+class stage:
+    '''Context manager that runs its body as stage `name'.'''
+
+    __slots__ = ( "name", "detail" )
+
+    def __init__( self, name, detail = None ):
+        self.name   = name
+        self.detail = detail
+
+    def __enter__( self ):
+        for listener in listeners:
+            listener.enter( self.name, self.detail )
+        return self
+
+    def __exit__( self, type, value, traceback ):
+        for listener in reversed( listeners ):
+            listener.leave( self.name, self.detail )
+        return False
+
+
+def staged( name ):
+    '''Decorator that runs every call of a function as stage `name'.'''
+    def decorate( function ):
+        code_stages[function.__code__] = name
+
+        @functools.wraps( function )
+        def wrapper( *args, **kwargs ):
+            if not listeners:
+                return function( *args, **kwargs )
+            with stage( name ):
+                return function( *args, **kwargs )
+
+        # profilers tell functions apart by their code; give every
+        # wrapper its own, named after the function it wraps
+        wrapper.__code__ = wrapper.__code__.replace(
+                             co_name = function.__name__ )
+        return wrapper
+    return decorate
+
+
+def find( key ):
+    '''Return the listener with the given key, or None.'''
+    for listener in listeners:
+        if listener.key == key:
+            return listener
+    return None
+
+
+def count( name, n = 1 ):
+    '''Add `n' to counter `name'.'''
+    counters[name] = counters.get( name, 0 ) + n
+
+
+def take():
+    '''Return the data collected by all listeners and the counters since
+    the last call.'''
+    data = dict( ( listener.key, listener.take() ) for listener in listeners )
+    data["counters"] = dict( counters )
+    counters.clear()
+    return data
+
+
+def merge( data ):
+    '''Add data returned by `take' in a worker to the local listeners and
+    counters.'''
+    for listener in listeners:
+        if listener.key in data:
+            listener.merge( data[listener.key] )
+    for name, n in data.get( "counters", {} ).items():
+        count( name, n )
+
+# eof
@@ -0,0 +1,144 @@
+#
+#  journal.py
+#
+#    Journal of the files converted by a run (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Record the files a run has converted, so that a run that was stopped
+can go on where it stopped.
+
+The journal is a file in the output directory with a JSON record for
+every file whose output is complete:
+
+    { "input"  : "include/freetype/freetype.h",
+      "source" : "186023:1541687221000000000",
+      "output" : "freetype/freetype.h",
+      "sha256" : "9f3c...",
+      "options": "..." }
+
+`source' stands for the content of the input: its size and time of
+modification, or its blob in `utils.rev'.  `options' stands for the
+settings that change the output.  Records are only appended, each one
+flushed when it is written; a run that is killed leaves at most an
+incomplete last line, which is ignored.
+
+A file counts as done if its last record has the same source and
+options, and its output file still has the recorded hash.
+
+Typical usage:
+    log = journal.Journal( "docs", type )
+    todo = [f for f in file_list if not log.done( f )]
+    for f in todo:
+        ...                         # convert and write f
+        log.add( f )
+    log.close()
+'''
+from __future__ import print_function
+import hashlib, json, os
+import utils
+
+
+# Name of the journal in the output directory
+#
+name = "convert-journal.jsonl"
+
+
+class Journal:
+    '''The journal of an output directory, open for appending'''
+
+    def __init__( self, output_dir, type ):
+        self.filename = os.path.join( output_dir, name )
+        self.options  = options( type )
+        self.records  = load( self.filename )
+        self.file     = open( self.filename, "a" )
+        if self.file.tell() and not ends_line( self.filename ):
+            # complete the line cut off by a run that was stopped
+            self.file.write( "\n" )
+
+    def done( self, filename ):
+        '''Tell whether the output of input `filename' is complete.'''
+        record = self.records.get( filename )
+        if ( not record
+             or record.get( "options" ) != self.options
+             or record.get( "source" ) != source( filename )
+             or record.get( "output" ) != utils.output_name( filename ) ):
+            return False
+        try:
+            return digest( utils.output_path( record["output"] ) ) \
+                   == record.get( "sha256" )
+        except ( IOError, OSError ):
+            return False
+
+    def add( self, filename ):
+        '''Record that the output of input `filename' is complete.'''
+        output = utils.output_name( filename )
+        record = { "input"  : filename,
+                   "source" : source( filename ),
+                   "output" : output,
+                   "sha256" : digest( utils.output_path( output ) ),
+                   "options": self.options }
+        self.records[filename] = record
+        self.file.write( json.dumps( record, sort_keys = True ) + "\n" )
+        self.file.flush()
+
+    def close( self ):
+        self.file.close()
+
+
+def load( filename ):
+    '''Return the last record of every input in journal `filename'.'''
+    records = {}
+    try:
+        with open( filename ) as f:
+            for line in f:
+                try:
+                    record = json.loads( line )
+                except ValueError:
+                    continue
+                if isinstance( record, dict ) and "input" in record:
+                    records[record["input"]] = record
+    except ( IOError, OSError ):
+        pass
+    return records
+
+
+def ends_line( filename ):
+    '''Tell whether a non-empty file ends with a newline.'''
+    with open( filename, "rb" ) as f:
+        f.seek( -1, os.SEEK_END )
+        return f.read( 1 ) == b"\n"
+
+
+def options( type ):
+    '''Return a string standing for the settings that change the output
+    of a run converting with `type'.'''
+    return json.dumps( [type, utils.block_tables, utils.bytes_mode,
+                        utils.compress, utils.only_sections,
+                        utils.only_symbols, utils.only_tags] )
+
+
+def source( filename ):
+    '''Return a string standing for the content of input `filename'.'''
+    if filename in utils.blobs:
+        return "blob:" + utils.blobs[filename][0]
+    st = os.stat( filename )
+    return "%d:%d" % ( st.st_size, st.st_mtime_ns )
+
+
+def digest( filename ):
+    '''Return the SHA-256 of a file, as hexadecimal digits.'''
+    sha = hashlib.sha256()
+    with open( filename, "rb" ) as f:
+        for chunk in iter( lambda: f.read( 1 << 20 ), b"" ):
+            sha.update( chunk )
+    return sha.hexdigest()
+
+# eof
@@ -21,6 +21,9 @@ Typical usage:
     import markdown
     converter = markdown.Markify()
     converter.markify( lines )
+
+Pass `block_tables = True' to lay out field tables one block at a time
+instead of line by line, see `mdutils.table_block'.
 """
 from __future__ import print_function
 import re
@@ -94,6 +97,7 @@ start = r'''
 '''
 
 column = r'''
+  (?<!\s)        # (not inside white space, see `new_markup_tag')
   (\s*           # any number of whitespace
   \*{1})(?![*/]) # followed by precisely one asterisk (group1) not followed by `/'
   (.*)          # then anything (group2)
@@ -108,13 +112,68 @@ re_source_new_format = DocBlockFormat( 2, start, column, end )
 
 
 
+# `new_markup_tag' and the `column' pattern above are searched for and
+# start with white space; a match from inside a run of white space is also
+# one from its start, so they are not tried after white space, which
+# would take quadratic time on long runs.
+#
 old_markup_tag = re.compile( r'''<((?:\w|-)*)>''' )  # <xxxx> format
-new_markup_tag = re.compile( r'''\s*@((?:\w|-)*):''' )  # @xxxx: format
+new_markup_tag = re.compile( r'''(?<!\s)\s*@((?:\w|-)*):''' )  # @xxxx: format
         
 
+# A line that starts a block in the new format, anywhere in a file
+#
+re_new_format_start = re.compile( r'''
+  ^[^\S\n]*     # any number of whitespace on the same line
+  /\*{2,}       # followed by '/' and at least two asterisks
+  [^\S\n]*$     # probably followed by whitespace
+''', re.VERBOSE | re.MULTILINE )
+
+
+# The same for files read as bytes, see `sources.re_block_start_bytes'
+#
+re_new_format_start_bytes = re.compile( rb'''
+  ^[ \t\r\f\v\x1c-\x1f\x80-\xff]*   # bytes that may be whitespace
+  /\*{2,}                           # then '/' and at least two asterisks
+  [ \t\r\f\v\x1c-\x1f\x80-\xff]*$   # bytes that may be whitespace
+''', re.VERBOSE | re.MULTILINE )
+
+
+def classify_file( text ):
+    """Tell whether `Markify' would leave a whole file unchanged: with no
+    block in the new format, every block is kept as it is.  `text' may
+    also be bytes."""
+    start = re_new_format_start_bytes if isinstance( text, bytes ) \
+            else re_new_format_start
+    if start.search( text ):
+        return None
+    return "format1"
+
+
+def classify( lines ):
+    """Tell whether `Markify.convert' would return a block unchanged,
+    without converting it.  Returns the reason, or None if the block
+    must be converted.
+
+      'format1'  A block in the old format, which Markify keeps as it is;
+                 it must not contain a start line of the new format,
+                 which would make Markify process the lines after it.
+    """
+    if not re_source_old_format.start.match( lines[0] ):
+        return None
+    for line in lines[1:]:
+        if re_source_new_format.start.match( line ):
+            return None
+    return "format1"
+
+
 class Markify:
 
-    def __init__(self):
+    def __init__(self, block_tables = False):
+        self.block_tables = block_tables
+        self.tables = None
+        self.columns = None
+        self.index = -1
         self.started = False
         self.line = None
         self.ended = False
@@ -141,8 +200,13 @@ class Markify:
         # set newlinechar in mdutils
         mdutils.newlinechar = self.newlinechar
 
+        if self.block_tables:
+            # lay out all field tables of the block in advance
+            self.tables = self.layout_tables(lines)
+
         for line in lines:
             self.line = line
+            self.index += 1
 
             if self.format == None:
                 # If no format or old comment block format
@@ -182,19 +246,26 @@ class Markify:
     def processLine(self):
         '''Process line and convert to markdown'''
 
-        tag_search = re.search(new_markup_tag, self.line)
+        if self.tables is not None:
+            # reuse the matches of `layout_tables'
+            tag_search, precontent, content = self.columns[self.index]
+        else:
+            tag_search = re.search(new_markup_tag, self.line)
+            precontent, content = None, None
+            m = re.search(re_source_new_format.column, self.line)
+            if m:
+                precontent, content = m.group(1), m.group(2).rstrip()
+
         if tag_search:
             # If markup tag exists, start a content block 
             self.inside_markup = True
             mdutils.end_table()
 
         if self.format == 2:
-            m = re.search(re_source_new_format.column, self.line)
-            if m:
+            if content is not None:
                 # Get the beginning and push rest through markdown checks
-                self.precontent = m.group(1)
-                self.content = m.group(2)
-                self.content = self.content.rstrip()
+                self.precontent = precontent
+                self.content = content
                 # Set the column_started flag
                 self.column_started = True
 
@@ -202,7 +273,7 @@ class Markify:
                 # Italics and Bold
                 #########################################
                 # handle markup for italic and bold
-                if not self.in_code:
+                if not self.in_code and self.tables is None:
                     # If not in a code block
                     self.content = mdutils.emphasis( self.content )
                     self.line = self.precontent + self.content + self.newlinechar
@@ -211,10 +282,14 @@ class Markify:
                 # Field entries
                 #########################################
                 # handle markup for field entries
-                if not self.in_code:
+                if not self.in_code and self.tables is None:
                     # If not in a code block
                     self.content = mdutils.table( self.precontent, self.content )
                     self.line = self.precontent + self.content + self.newlinechar
+                elif not self.in_code:
+                    # Emphasis and tables were done for the whole block
+                    self.content = self.tables[self.index]
+                    self.line = self.precontent + self.content + self.newlinechar
 
                 #########################################
                 # Quotes
@@ -253,7 +328,43 @@ class Markify:
             self.ended = True
             self.inside_markup = False
 
+    def layout_tables(self, lines):
+        '''Convert the field tables of a block in one go.
+
+        Returns a dictionary mapping line indices to converted content,
+        or None if the block will be returned unchanged anyway.  The
+        markup tag and column matches of every line are kept in
+        `self.columns' for `processLine'.'''
+        items = []
+        for i, line in enumerate(lines):
+            if re_source_old_format.start.match(line):
+                # special block, see `convert'
+                return None
+            if re_source_new_format.start.match(line):
+                break
+            items.append((False, None, None))
+        else:
+            return None
+
+        # the start line itself is not processed
+        items.append((False, None, None))
+        tag_search = new_markup_tag.search
+        column_search = re_source_new_format.column.search
+        for line in lines[len(items):]:
+            tag = tag_search(line) is not None
+            m = column_search(line)
+            if m:
+                items.append((tag, m.group(1), m.group(2).rstrip()))
+            else:
+                items.append((tag, None, None))
+
+        self.columns = items
+        return mdutils.table_block(items)
+
     def refresh(self):
+        self.tables = None
+        self.columns = None
+        self.index = -1
         self.started = False
         self.line = None
         self.ended = False
@@ -58,14 +58,17 @@ re_bold   = re.compile( r"\*((?:\w|-)(?:\w|'|-)*)\*(.*)" )   #  *emphasis*
 #   foo     ::
 #   foo.bar ::
 #
+# The white space after the name is only part of the pattern when there is
+# a name; otherwise both runs of white space could take the same spaces,
+# and a long line of spaces without `::' would take quadratic time.
+#
 re_field = re.compile( r"""
                          \s*
-                           (
-                             \w*
-                           |
-                             \w (\w | \.)* \w
-                           )
-                         (\s*) ::
+                           (?:
+                             \w ( [\w.]* \w )?
+                             \s*
+                           )?
+                         ::
                        """, re.VERBOSE )
 
 #
@@ -93,12 +96,29 @@ re_code_end   = re.compile( r"(\s*)}\s*$" )
 # It looks for a '_' or '.' in the text and categorizes it as an inline
 # code block. Manual cleanup may be required
 #
-re_inline_code   = re.compile( r"(^|\W)`((?:\w| |\.|\*)+(?:(?:\->)|[_.+=])+[\s\w\->_+.=]+)'(\W|$)" )
+# The code must have the form
+#
+#   (?:\w| |\.|\*)+ (?:->|[_.+=])+ [\s\w\->_+.=]+
+#
+# As a single regular expression, the overlapping parts backtrack for a
+# time that grows with a power of the length of a quote that doesn't
+# match.  No part contains the closing quote, so the quoted text is all
+# of the characters of the three parts that follow the opening quote;
+# `re_inline_code' finds them in linear time and `is_inline_code' checks
+# the form.
+#
+re_inline_code   = re.compile( r"(^|\W)`([\w\s.*>+=-]+)'(\W|$)" )
+re_inline_head   = re.compile( r"(?:\w| |\.|\*)*" )
+re_inline_nontail = re.compile( r"[^\s\w\->_+.=]" )
 
 # Try to find camelCase variable nemes
-re_inline_code_2 = re.compile( r"(^|\W)`([a-z|\d]+[A-Z]+(?:[a-z|A-Z|\d]+)?)'(\W|$)" )
+re_inline_code_2 = re.compile( r"(^|\W)`([a-z|\d]+[A-Z][a-zA-Z|\d]*)'(\W|$)" )
 
+# Any other quote.  A quote without an end is looked for again from every
+# opening quote after it, see `convert_other_quotes'.
 re_other_quote = re.compile( r"(^|\W)`(.*?)'(\W|$)" )
+re_quote_start = re.compile( r"(^|\W)`" )
+re_quote_end   = re.compile( r"'(?=\W|$)|\n" )
 
 # Find new markup tags
 new_markup_tag = re.compile( r'''(\s*)@((?:\w|-)*):(.*)''' )  # @xxxx: format
@@ -170,11 +190,108 @@ def convert_table( precontent, content, indent ):
     # print(new_content)
     return new_content
 
+def table_block( items ):
+    '''Block-level table converter
+
+    `items' holds one `( tag, precontent, content )' tuple per line of a
+    comment block, where `tag' is true for lines starting a markup section
+    and `content' is the unboxed column content (None for other lines).
+
+    The first pass walks the block once and collects the field entries of
+    each section, skipping code sequences like `code_block' does.  The
+    second pass lays the entries out.  Returns a dictionary mapping the
+    index of every line outside code sequences to its content after the
+    emphasis and table rules, without touching the module state used by
+    `table'.'''
+    entries = []    # [index, indent, field length, continuation indices]
+    entry   = None
+    plain   = {}
+
+    # Markify skips the table rule one line later than the code sequence
+    # starts and ends, and the sequence may be left open by the previous
+    # block, so follow both states
+    in_code     = False
+    code_mode   = mode
+    code_margin = margin
+
+    for i, ( tag, precontent, content ) in enumerate( items ):
+        if tag:
+            entry = None
+        if content is None:
+            continue
+
+        text = content
+        if not in_code:
+            text = plain[i] = emphasis( content )
+            m = "::" in text and re_field.match( text )
+            if m:
+                indent = len( text ) - len( text.lstrip() )
+                entry  = [i, indent, len( m.group( 0 ) ), []]
+                entries.append( entry )
+            elif entry and len( text.strip() ) > 0:
+                entry[3].append( i )
+                text = " " * ( entry[1] + 2 ) + text.strip()
+
+        if code_mode == mode_code:
+            m = re_code_end.match( text )
+            if m and len( m.group( 1 ) ) <= code_margin:
+                code_mode = mode_none
+                in_code   = False
+            else:
+                in_code = True
+        else:
+            m = re_code_start.match( text )
+            if m:
+                code_margin = len( m.group( 1 ) )
+                code_mode   = mode_code
+                in_code     = True
+
+    # second pass: lay out the collected entries
+    for index, indent, field_len, continued in entries:
+        content    = plain[index]
+        field_pre  = content[:field_len-2].rstrip() + " ::"
+        field_desc = content[field_len:].strip()
+        if len( field_desc ) != 0:
+            field_desc = ( newlinechar + items[index][1]
+                           + " " * ( indent + 2 ) + field_desc )
+        plain[index] = field_pre + field_desc
+
+        margin_text = " " * ( indent + 2 )
+        for i in continued:
+            plain[i] = margin_text + plain[i].strip()
+
+    return plain
+
 def end_table( ):
     '''Explicitly signal end of a table field markup'''
     global inside_field
     inside_field = False
 
+def reset( ):
+    '''Reset all module state, including an unfinished code sequence'''
+    global inside_field, field_indent, cur_lines, mode, margin
+    inside_field = False
+    field_indent = 0
+    cur_lines    = []
+    mode         = mode_none
+    margin       = -1
+
+
+def save( ):
+    '''Return the state that goes on in the next block: an unfinished code
+    sequence, or None'''
+    if mode != mode_code:
+        return None
+    return ( margin, cur_lines )
+
+def restore( state ):
+    '''Go on with a state returned by `save'.'''
+    global mode, margin, cur_lines
+    reset()
+    if state:
+        mode              = mode_code
+        margin, cur_lines = state
+
 
 def check_emp( content, type = 1 ):
     '''Emphasis converter internal function'''
@@ -296,20 +413,87 @@ def convert_code_block( precontent, line ):
         else:
             return None, 0
 
+def is_inline_code( text ):
+    '''Tell whether quoted `text' has the form of inline code, see
+    `re_inline_code'.'''
+    # the first part can end anywhere up to `head', the last part start
+    # anywhere from `tail'; a single operator between them is enough, as
+    # the last part takes any more of them
+    head = re_inline_head.match( text ).end()
+    tail = 0
+    for m in re_inline_nontail.finditer( text ):
+        tail = m.end()
+    for i in range( max( 1, tail - 2 ), min( head, len( text ) - 2 ) + 1 ):
+        if text[i] in "_.+=" and i + 1 >= tail:
+            return True
+        if text.startswith( "->", i ) and tail <= i + 2 < len( text ):
+            return True
+    return False
+
+def convert_inline_code( line ):
+    '''Mark inline code with a sentinel, like `re.sub' would with the
+    single regular expression described at `re_inline_code'.'''
+    parts = []
+    done  = 0
+    pos   = 0
+    while True:
+        m = re_inline_code.search( line, pos )
+        if not m:
+            break
+        if is_inline_code( m.group( 2 ) ):
+            parts.append( line[done:m.start()] )
+            parts.append( m.expand( r'\g<1>/quot/\g<2>/quot/\g<3>' ) )
+            done = pos = m.end()
+        else:
+            pos = m.start() + 1
+    parts.append( line[done:] )
+    return "".join( parts )
+
+def convert_other_quotes( line ):
+    '''Replace the quotes of `re_other_quote' like `re.sub' would, but
+    skip the opening quotes that have no end in linear time.'''
+    # the position of the first end of a quote (or of a newline) after
+    # each opening quote is looked up in `ends'
+    ends  = [m.start() for m in re_quote_end.finditer( line )]
+    if ends and line[ends[-1]] == "'" and line.rfind( "`" ) < ends[-1]:
+        if "\n" not in line[:ends[-1]]:
+            # every opening quote has an end
+            return re_other_quote.sub( r"\1'\2'\3", line )
+    parts = []
+    done  = 0
+    pos   = 0
+    index = 0
+    while True:
+        start = re_quote_start.search( line, pos )
+        if not start:
+            break
+        while index < len( ends ) and ends[index] < start.end():
+            index += 1
+        if index == len( ends ) or line[ends[index]] == "\n":
+            # no end on this line
+            pos = start.start() + 1
+            continue
+        m = re_other_quote.match( line, start.start() )
+        parts.append( line[done:m.start()] )
+        parts.append( m.expand( r"\1'\2'\3" ) )
+        done = pos = m.end()
+    parts.append( line[done:] )
+    return "".join( parts )
+
 def convert_quotes( content ):
     '''Quotes converter internal function'''
+    if "`" not in content:
+        # no quotes to convert
+        return content.replace( "/quot/", "`" )
+
     # We check if inline code may be present, and add a
     # random sentinel to it, so that it can be replaced
     # later.
-    line = re.sub( re_inline_code,
-                   r'\g<1>/quot/\g<2>/quot/\g<3>',
-                   content )
+    line = convert_inline_code( content )
     line = re.sub( re_inline_code_2,
                    r'\g<1>/quot/\g<2>/quot/\g<3>',
                    line )
-    line = re.sub( re_other_quote,
-                   r"\1'\2'\3",
-                   line )
+    line = convert_other_quotes( line )
     # Replace all ` with ' because quotes accross multiple
     # lines cannot be inline code sequences
     line = line.replace( "`", "'" )
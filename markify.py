@@ -18,7 +18,7 @@
 from sources   import *
 from utils     import *
 
-import utils
+import utils, batch, shards
 
 import sys, glob, getopt
 
@@ -26,11 +26,69 @@ import sys, glob, getopt
 def  usage():
     print( "Markify Usage information\n" )
     print( "  markify file1 [file2 ...]\n" )
+    print( "  markify - < file.h > output.h\n" )
     print( "using the following options:\n" )
     print( "  -h : print this page" )
     print( "  -o : set output directory, as in '-o mydir'" )
+    print( "  -b : lay out field tables per block instead of per line" )
+    print( "  -j : number of worker processes, as in '-j 4'" )
+    print( "  -k : convert each file in a worker process, continue after" )
+    print( "       failures and summarize them at the end" )
     print( "" )
     print( "  --output : same as -o, as in '--output=mydir'" )
+    print( "  --jobs : same as -j, as in '--jobs=4'" )
+    print( "  --keep-going : same as -k" )
+    print( "  --block-jobs : without -j and -k, convert the blocks of large" )
+    print( "                 files on several processes, as in" )
+    print( "                 '--block-jobs=4'" )
+    print( "  --timeout : with -k, seconds after which a file counts as" )
+    print( "              failed, as in '--timeout=60'" )
+    print( "  --since : only convert files changed since a git revision," )
+    print( "            as in '--since=origin/master'" )
+    print( "  --rev : read the inputs from a git revision instead of the" )
+    print( "          work tree; a directory stands for its .h files, as" )
+    print( "          in '--rev=VER-2-9-1 include/freetype'" )
+    print( "  --resume : with -o, skip the files converted by an earlier" )
+    print( "             run with --resume whose outputs are intact, and" )
+    print( "             record the files converted in a journal" )
+    print( "  --shard : only convert part INDEX of COUNT parts of equal" )
+    print( "            size, as in '--shard=2/8'" )
+    print( "  --compress : with -o, compress output files, as in" )
+    print( "               '--compress=gz' or '--compress=xz'" )
+    print( "  --link : with -o, hard link output files that are the same" )
+    print( "           as their input instead of copying them" )
+    print( "  --bytes : read and write files as bytes; only the lines of" )
+    print( "            documentation blocks are decoded, as UTF-8, and" )
+    print( "            all other bytes are written back unchanged" )
+    print( "  --only-section : only convert the documentation blocks of a" )
+    print( "                   section, as in '--only-section=gzip'; the" )
+    print( "                   options --only-* can be repeated and take" )
+    print( "                   wildcards" )
+    print( "  --only-symbol : only convert the documentation blocks of a" )
+    print( "                  symbol, as in '--only-symbol=FT_Get_*'" )
+    print( "  --only-tag : only convert the documentation blocks with a" )
+    print( "               tag, as in '--only-tag=struct'" )
+    print( "  --line : only convert the documentation block at a line of" )
+    print( "           a single input and print it as JSON, as in" )
+    print( "           '--line=120'" )
+    print( "  --range : same as --line for a range of lines, as in" )
+    print( "            '--range=120:135'" )
+    print( "  --memprofile : write peak memory and allocation sites per" )
+    print( "                 file and stage to a report, as in" )
+    print( "                 '--memprofile=memory.txt'" )
+    print( "  --memdepth : frames traced per allocation for --memprofile" )
+    print( "               (default 1; deeper is slower), as in" )
+    print( "               '--memdepth=8'" )
+    print( "  --profile : write a call profile to OUT.pstats and collapsed" )
+    print( "              stacks to OUT.folded, as in '--profile=OUT'" )
+    print( "  --trace : write a timeline of the stages in every worker in" )
+    print( "            Chrome trace format, as in '--trace=run.json'" )
+    print( "  --export : write the tags, fields and code of every" )
+    print( "             documentation block as JSON Lines, as in" )
+    print( "             '--export=blocks.jsonl'" )
+    print( "  --stats : print how many blocks and files were converted or" )
+    print( "            passed through unchanged" )
+    print( "  --block-tables : same as -b" )
 
 def  main( argv ):
     """Main program loop."""
@@ -39,8 +97,15 @@ def  main( argv ):
 
     try:
         opts, args = getopt.getopt( sys.argv[1:],
-                                    "ho:",
-                                    ["help", "output="] )
+                                    "ho:bj:k",
+                                    ["help", "output=", "block-tables",
+                                     "jobs=", "keep-going", "block-jobs=",
+                                     "timeout=", "since=", "rev=", "resume",
+                                     "shard=", "compress=", "link", "bytes",
+                                     "memprofile=", "memdepth=", "profile=",
+                                     "trace=", "export=", "stats", "line=",
+                                     "range=", "only-section=",
+                                     "only-symbol=", "only-tag="] )
     except getopt.GetoptError:
         usage()
         sys.exit( 2 )
@@ -61,16 +126,107 @@ def  main( argv ):
             utils.output_dir = opt[1]
             utils.flush_to_file = True
 
-    check_output()
+        if opt[0] in ( "-j", "--jobs" ):
+            try:
+                utils.jobs = int( opt[1] )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] == "--block-jobs":
+            try:
+                utils.block_jobs = int( opt[1] )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] in ( "-k", "--keep-going" ):
+            utils.keep_going = True
+
+        if opt[0] == "--timeout":
+            try:
+                utils.timeout = float( opt[1] )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] == "--since":
+            utils.since = opt[1]
+
+        if opt[0] == "--rev":
+            utils.rev = opt[1]
+
+        if opt[0] == "--resume":
+            utils.resume = True
+
+        if opt[0] in ( "--line", "--range" ):
+            try:
+                first, sep, last = opt[1].partition( ":" )
+                utils.line_range = ( int( first ), int( last or first ) )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] == "--only-section":
+            utils.only_sections.append( opt[1] )
+
+        if opt[0] == "--only-symbol":
+            utils.only_symbols.append( opt[1] )
+
+        if opt[0] == "--only-tag":
+            utils.only_tags.append( opt[1] )
+
+        if opt[0] == "--memprofile":
+            utils.memprofile = opt[1]
+
+        if opt[0] == "--memdepth":
+            try:
+                utils.memdepth = max( 1, int( opt[1] ) )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
 
-    # create context and processor
-    source_processor  = SourceProcessor(type = 2)
+        if opt[0] == "--profile":
+            utils.profile = opt[1]
+
+        if opt[0] == "--trace":
+            utils.trace = opt[1]
+
+        if opt[0] == "--export":
+            utils.export = opt[1]
+
+        if opt[0] == "--stats":
+            utils.stats = True
+
+        if opt[0] == "--compress":
+            if opt[1] not in ( "gz", "xz" ):
+                usage()
+                sys.exit( 2 )
+            utils.compress = opt[1]
+
+        if opt[0] == "--link":
+            utils.link = True
+
+        if opt[0] == "--bytes":
+            utils.bytes_mode = True
+
+        if opt[0] == "--shard":
+            try:
+                utils.shard = shards.parse( opt[1] )
+            except ValueError:
+                usage()
+                sys.exit( 2 )
+
+        if opt[0] in ( "-b", "--block-tables" ):
+            utils.block_tables = True
+
+    check_output()
 
     # retrieve the list of files to process
     file_list = make_file_list( args )
-    for filename in file_list:
-        blocks = source_processor.parse_file( filename )
-        write_to_file( blocks, filename )
+    if batch.process_files( file_list, 2 ):
+        sys.exit( 1 )
+
 # if called from the command line
 if __name__ == '__main__':
     main( sys.argv )
@@ -0,0 +1,288 @@
+#
+#  memprofile.py
+#
+#    Peak memory and allocation sites per file and stage (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Record memory use of the conversion pipeline with `tracemalloc'.
+
+`MemoryProfile' is a listener for the stages of `instrument.py'.  For
+every outermost stage (a file being converted, or written) it records
+
+  - the peak of traced memory above the level at the start of the stage,
+    for the stage itself and, as a maximum over all calls, for every
+    stage nested in it;
+
+  - the allocation sites of the memory still held at the end of the
+    stage, and for every stage directly in it (`read', `parse', `join',
+    ...) those of the memory allocated during that stage and still held
+    at its end.
+
+The stages directly in an outermost stage are told apart by snapshots
+taken when they are left, whatever code they run; the snapshot at the
+end of one is the start of the next, so memory allocated between two of
+them counts for the next one.  Deeper stages, like `convert' in
+`parse', are only found on the traceback of an allocation, as the
+innermost staged function on it; taking a snapshot at every nested
+stage would make the conversion a hundred times slower.  Peaks include
+short-lived garbage, while allocation sites only show what a stage
+leaves behind.
+
+Only `frames' frames are stored per allocation.  The cost of tracing
+grows quickly with it, see `README.md'; one frame finds a deeper stage
+only for what its staged function allocates itself.
+
+Typical usage:
+    profile = memprofile.MemoryProfile()
+    profile.start()
+    instrument.listeners.append( profile )
+    ...
+    profile.write( "memory.txt" )
+'''
+from __future__ import print_function
+import os, tracemalloc
+import instrument
+
+
+# Default number of frames stored per allocation
+#
+frames = 1
+
+# Number of allocation sites listed per file and per stage
+#
+top_sites = 10
+
+
+class Level:
+    '''A stage being run'''
+
+    __slots__ = ( "name", "detail", "base", "peak", "stages", "nested" )
+
+    def __init__( self, name, detail, base ):
+        self.name   = name
+        self.detail = detail
+        self.base   = base
+        self.peak   = base
+        self.stages = {}        # nested stage -> [calls, max peak]
+        self.nested = []        # sites of the stages directly in it
+
+
+class MemoryProfile:
+    '''Listener recording peak memory and allocation sites per stage'''
+
+    key = "memory"
+
+    def __init__( self, frames = frames ):
+        self.frames  = frames
+        self.stack   = []
+        self.records = []
+        self.first   = None     # memory held at the start of a file
+        self.last    = None     # and at the end of its last stage
+        self.ranges  = None
+
+    def start( self ):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start( self.frames )
+
+    def enter( self, name, detail ):
+        if not self.stack:
+            self.first = self.last = held()
+        current, peak = tracemalloc.get_traced_memory()
+        if self.stack:
+            outer      = self.stack[-1]
+            outer.peak = max( outer.peak, peak )
+        tracemalloc.reset_peak()
+        self.stack.append( Level( name, detail, current ) )
+
+    def leave( self, name, detail ):
+        peak  = tracemalloc.get_traced_memory()[1]
+        level = self.stack.pop()
+        level.peak = max( level.peak, peak )
+
+        if self.stack:
+            self.stack[-1].peak = max( self.stack[-1].peak, level.peak )
+            entry    = self.stack[0].stages.setdefault( name, [0, 0] )
+            entry[0] += 1
+            entry[1]  = max( entry[1], level.peak - level.base )
+            if len( self.stack ) == 1:
+                after = held()
+                self.stack[0].nested.extend(
+                  self.sites( self.last, after, name ) )
+                self.last = after
+            tracemalloc.reset_peak()
+            return
+
+        sites = self.sites( self.first, held(), level.name, False )
+        self.records.append( { "name"  : level.name,
+                               "detail": level.detail,
+                               "peak"  : level.peak - level.base,
+                               "stages": level.stages,
+                               "sites" : sites,
+                               "nested": level.nested } )
+        self.first = self.last = None
+        tracemalloc.reset_peak()
+
+    def take( self ):
+        records      = self.records
+        self.records = []
+        return records
+
+    def merge( self, records ):
+        self.records.extend( records )
+
+    def stage_of( self, traceback, default ):
+        '''Return the stage of the innermost staged function found in
+        `traceback', or `default'.'''
+        if self.ranges is None:
+            self.ranges = []
+            for code, name in instrument.code_stages.items():
+                lines = [line for start, end, line in code.co_lines()
+                         if line is not None]
+                self.ranges.append( ( code.co_filename, min( lines ),
+                                      max( lines ), name ) )
+
+        for frame in reversed( traceback ):
+            for filename, first, last, name in self.ranges:
+                if ( frame.filename == filename
+                     and first <= frame.lineno <= last ):
+                    return name
+        return default
+
+    def sites( self, before, after, default, deeper = True ):
+        '''Return `[stage, site, size]' for the memory allocated between
+        two results of `held' and still held, largest first.  The stage
+        is `default', or with `deeper' the one found by `stage_of'.'''
+        # the allocations of the profiling itself are left out; this is
+        # what `Snapshot.filter_traces' would do, but on the few grouped
+        # differences instead of every trace of both snapshots
+        ignore = [os.path.normcase( module.__file__ )
+                  for module in ( tracemalloc, instrument )]
+        ignore.append( os.path.normcase( __file__ ) )
+
+        sizes = {}
+        for traceback, size in after.items():
+            size -= before.get( traceback, 0 )
+            if size <= 0:
+                continue
+            frame = traceback[-1]
+            if os.path.normcase( frame.filename ) in ignore:
+                continue
+            where = "%s:%d" % ( os.path.basename( frame.filename ),
+                                frame.lineno )
+            stage = default
+            if deeper:
+                stage = self.stage_of( traceback, default )
+            key   = ( stage, where )
+            sizes[key] = sizes.get( key, 0 ) + size
+
+        result = [[stage, where, size]
+                  for ( stage, where ), size in sizes.items()]
+        result.sort( key = lambda x: ( -x[2], x[0], x[1] ) )
+
+        # only the largest sites of each stage are kept
+        count = {}
+        kept  = []
+        for entry in result:
+            count[entry[0]] = count.get( entry[0], 0 ) + 1
+            if count[entry[0]] <= top_sites:
+                kept.append( entry )
+        return kept
+
+    def write( self, filename ):
+        '''Write the report for all records to `filename'.'''
+        with open( filename, "w" ) as f:
+            report( self.records, f )
+
+
+def held():
+    '''Return the traced memory held now, as a `traceback -> size'
+    dictionary.  Snapshots are not traced, so they don't change the
+    peaks.'''
+    return dict( ( stat.traceback, stat.size ) for stat
+                 in tracemalloc.take_snapshot().statistics( "traceback" ) )
+
+
+def report( records, f ):
+    '''Print a memory report for `records' to the file object `f'.'''
+    files  = []             # details in order of appearance
+    peaks  = {}             # detail -> stage -> peak
+    sites  = {}             # detail -> site -> size
+    stages = {}             # stage -> [calls, max peak, site -> size]
+    order  = []
+
+    def  add( name, calls, peak ):
+        if name not in stages:
+            stages[name] = [0, 0, {}]
+            order.append( name )
+        stages[name][0] += calls
+        stages[name][1]  = max( stages[name][1], peak )
+
+    for record in records:
+        detail = record["detail"] or "-"
+        if detail not in peaks:
+            files.append( detail )
+            peaks[detail] = {}
+            sites[detail] = {}
+        add( record["name"], 1, record["peak"] )
+        peaks[detail][record["name"]] = record["peak"]
+        for name, ( calls, peak ) in record["stages"].items():
+            add( name, calls, peak )
+            peaks[detail][name] = max( peaks[detail].get( name, 0 ), peak )
+        for stage, where, size in record["sites"]:
+            sites[detail][where] = sites[detail].get( where, 0 ) + size
+        for stage, where, size in record["sites"] + record["nested"]:
+            add( stage, 0, 0 )
+            held = stages[stage][2]
+            held[where] = held.get( where, 0 ) + size
+
+    if not records:
+        print( "no files were profiled", file = f )
+        return
+
+    largest = max( files, key = lambda d: max( peaks[d].values() ) )
+    print( "memory profile of %d files, largest peak %d bytes in %s"
+           % ( len( files ), max( peaks[largest].values() ), largest ),
+           file = f )
+    print( "(peaks are bytes above the traced memory at the start of a"
+           " stage)\n", file = f )
+
+    print( "%-10s %8s %12s" % ( "stage", "calls", "max peak" ), file = f )
+    for name in order:
+        print( "%-10s %8d %12d" % ( name, stages[name][0], stages[name][1] ),
+               file = f )
+
+    print( "\npeak per file and stage\n", file = f )
+    print( "".join( "%12s" % name for name in order ) + "  input", file = f )
+    for detail in files:
+        print( "".join( "%12s" % peaks[detail].get( name, "" )
+                        for name in order ) + "  " + detail, file = f )
+
+    print( "\nallocation sites per stage (memory held at its end)", file = f )
+    for name in order:
+        held = stages[name][2]
+        if held:
+            print( "\n" + name, file = f )
+            print_sites( held, f )
+
+    print( "\nallocation sites per file (memory held at its end)", file = f )
+    for detail in files:
+        if sites[detail]:
+            print( "\n" + detail, file = f )
+            print_sites( sites[detail], f )
+
+
+def print_sites( sizes, f ):
+    '''Print the largest entries of a `site -> size' dictionary.'''
+    items = sorted( sizes.items(), key = lambda x: ( -x[1], x[0] ) )
+    for where, size in items[:top_sites]:
+        print( "  %12d  %s" % ( size, where ), file = f )
+
+# eof
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+#
+#  mergeshards.py
+#
+#    Merge and check the output directories of sharded runs.
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+
+import journal, shards
+
+import sys, os, getopt, filecmp, shutil
+
+
+def  usage():
+    print( "\nMergeShards Usage information\n" )
+    print( "  mergeshards [options] shard_dir1 [shard_dir2 ...]\n" )
+    print( "using the following options:\n" )
+    print( "  -h : print this page" )
+    print( "  -o : copy the merged outputs to a directory, as in '-o mydir'" )
+    print( "  -f : compare the merged outputs with the output directory of" )
+    print( "       a full run, as in '-f fulldir'" )
+    print( "" )
+    print( "  --output : same as -o, as in '--output=mydir'" )
+    print( "  --full : same as -f, as in '--full=fulldir'" )
+
+
+def  collect( dirs ):
+    """Read the manifests of all shard directories.  Returns a dictionary
+       mapping each output path to its shard directory, and a list of
+       problems found."""
+    problems = []
+    owner    = {}
+    seen     = {}
+    counts   = set()
+
+    for directory in dirs:
+        manifests = shards.read_manifests( directory )
+        if not manifests:
+            problems.append( directory + ": no shard manifest" )
+        for index, count, outputs in manifests:
+            counts.add( count )
+            if index in seen:
+                problems.append( "shard " + str( index ) + " found in both "
+                                 + seen[index] + " and " + directory )
+            seen[index] = directory
+            for output in outputs:
+                if output in owner:
+                    problems.append( output + " written by more than one "
+                                     + "shard" )
+                elif not os.path.isfile( os.path.join( directory, output ) ):
+                    problems.append( output + " missing in " + directory )
+                owner[output] = directory
+
+    if len( counts ) > 1:
+        problems.append( "shards of different runs: counts "
+                         + ", ".join( str( c ) for c in sorted( counts ) ) )
+    elif counts:
+        missing = set( range( 1, counts.pop() + 1 ) ) - set( seen )
+        for index in sorted( missing ):
+            problems.append( "shard " + str( index ) + " is missing" )
+
+    return owner, problems
+
+
+def  full_outputs( directory ):
+    """List the output files of a full run, relative to `directory'."""
+    result = set()
+    for root, subdirs, files in os.walk( directory ):
+        for name in files:
+            path = os.path.relpath( os.path.join( root, name ), directory )
+            # the manifests and the journal of `--resume' are no outputs
+            if not shards.re_manifest.match( path ) and path != journal.name:
+                result.add( path )
+    return result
+
+
+def  compare( owner, directory ):
+    """Check that the union of the shard outputs equals a full run."""
+    problems = []
+    full     = full_outputs( directory )
+    for output in sorted( full - set( owner ) ):
+        problems.append( output + " is missing from the shards" )
+    for output in sorted( set( owner ) - full ):
+        problems.append( output + " is not part of the full run" )
+    for output in sorted( full & set( owner ) ):
+        if not filecmp.cmp( os.path.join( owner[output], output ),
+                            os.path.join( directory, output ), False ):
+            problems.append( output + " differs from the full run" )
+    return problems
+
+
+def  main( argv ):
+    """Main program loop."""
+
+    try:
+        opts, args = getopt.getopt( sys.argv[1:],
+                                    "ho:f:",
+                                    ["help", "output=", "full="] )
+    except getopt.GetoptError:
+        usage()
+        sys.exit( 2 )
+
+    if args == []:
+        usage()
+        sys.exit( 1 )
+
+    output_dir = None
+    full_dir   = None
+
+    for opt in opts:
+        if opt[0] in ( "-h", "--help" ):
+            usage()
+            sys.exit( 0 )
+
+        if opt[0] in ( "-o", "--output" ):
+            output_dir = opt[1]
+
+        if opt[0] in ( "-f", "--full" ):
+            full_dir = opt[1]
+
+    owner, problems = collect( args )
+    if full_dir:
+        problems += compare( owner, full_dir )
+
+    for problem in problems:
+        sys.stderr.write( problem + "\n" )
+    if problems:
+        sys.exit( 1 )
+
+    if output_dir:
+        for output, directory in sorted( owner.items() ):
+            target = os.path.join( output_dir, output )
+            if not os.path.isdir( os.path.dirname( target ) ):
+                os.makedirs( os.path.dirname( target ) )
+            shutil.copyfile( os.path.join( directory, output ), target )
+
+    print( str( len( owner ) ) + " outputs from " + str( len( args ) )
+           + " shard directories" )
+
+
+# if called from the command line
+if __name__ == '__main__':
+    main( sys.argv )
+
+# eof
@@ -0,0 +1,90 @@
+#
+#  scheduler.py
+#
+#    Cost model and task list for the worker pool (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Turn a list of files into a list of tasks for the worker pool.
+
+The cost of a file is estimated from its size, which `os.stat' gives
+without reading the file, so that the parent doesn't read every input
+once before any worker starts.  Expensive files become tasks of their
+own and are dispatched first, so that a huge header does not start last
+and finish long after everything else; small files are grouped into
+batches, so that they don't spend more time in the pipe than in the
+converter.
+
+Typical usage:
+    import scheduler
+    tasks = scheduler.schedule( file_list, jobs = 4 )
+'''
+from __future__ import print_function
+import os
+
+
+# The size of compressed files is multiplied by this factor (text
+# compresses about 4:1)
+#
+compressed_ratio = 4
+
+# Tasks are never cut smaller than this cost, to keep batches of tiny
+# files worth a round trip to a worker
+#
+min_task_cost = 32 * 1024
+
+# Aim for this many tasks per worker, so the load evens out at the end
+#
+tasks_per_worker = 8
+
+
+class Task:
+    '''A list of files to convert in one round trip to a worker'''
+
+    def __init__( self, files, cost ):
+        self.files = files
+        self.cost  = cost
+
+
+def estimate_cost( filename ):
+    '''Estimate the cost of converting a file'''
+    size = os.stat( filename ).st_size
+    if filename.endswith( ( ".gz", ".xz" ) ):
+        return compressed_ratio * size
+    return size
+
+
+def schedule( file_list, jobs, cost = estimate_cost ):
+    '''Return the tasks for `file_list', most expensive first.'''
+    costs = [( cost( f ), f ) for f in file_list]
+    if not costs:
+        return []
+
+    total = sum( c for c, f in costs )
+    limit = max( min_task_cost, total // ( jobs * tasks_per_worker ) )
+
+    tasks = []
+    batch = Task( [], 0 )
+    for c, f in sorted( costs, key = lambda x: ( -x[0], x[1] ) ):
+        if c >= limit:
+            tasks.append( Task( [f], c ) )
+            continue
+        batch.files.append( f )
+        batch.cost += c
+        if batch.cost >= limit:
+            tasks.append( batch )
+            batch = Task( [], 0 )
+    if batch.files:
+        tasks.append( batch )
+
+    tasks.sort( key = lambda t: -t.cost )
+    return tasks
+
+# eof
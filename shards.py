@@ -0,0 +1,96 @@
+#
+#  shards.py
+#
+#    Partitioning of input files for multi-node runs (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Split a list of input files into shards of roughly equal total size.
+
+The split only depends on the file names and sizes, so every machine
+working on the same tree computes the same shards.  Each shard run
+records the outputs it wrote in a manifest, which `mergeshards.py' uses
+to merge and check the shard outputs.
+
+Typical usage:
+    import shards
+    index, count = shards.parse( "2/8" )
+    mine = shards.select( file_list, index, count )
+'''
+from __future__ import print_function
+import os, re
+
+
+# Name of the manifest written to the output directory of a shard run
+#
+manifest_format = "shard-%d-of-%d.txt"
+re_manifest     = re.compile( r"shard-(\d+)-of-(\d+)\.txt$" )
+
+
+def parse( spec ):
+    '''Parse an `INDEX/COUNT' shard specification, where INDEX starts
+    at 1.  Raises ValueError for malformed or out of range values.'''
+    index, count = spec.split( "/" )
+    index, count = int( index ), int( count )
+    if count < 1 or index < 1 or index > count:
+        raise ValueError( "shard '" + spec + "' is out of range" )
+    return index, count
+
+
+def partition( file_list, count, size = os.path.getsize ):
+    '''Split `file_list' into `count' lists of roughly equal total size,
+    as returned by `size' for each file.
+
+    Files are handed out largest first, each to the shard with the
+    smallest total so far; ties are broken by path and shard number, so
+    the result is stable across machines.  Every shard keeps the sorted
+    order of the input list.'''
+    files  = sorted( set( file_list ) )
+    order  = sorted( files, key = lambda f: ( -size( f ), f ) )
+    totals = [0] * count
+    owner  = {}
+    for f in order:
+        shard    = totals.index( min( totals ) )
+        owner[f] = shard
+        totals[shard] += size( f )
+
+    result = [[] for i in range( count )]
+    for f in files:
+        result[owner[f]].append( f )
+    return result
+
+
+def select( file_list, index, count, size = os.path.getsize ):
+    '''Return the files of shard `index' (starting at 1) of `count'.'''
+    return partition( file_list, count, size )[index - 1]
+
+
+def write_manifest( output_dir, index, count, outputs ):
+    '''Record the output files written by a shard run'''
+    name = os.path.join( output_dir, manifest_format % ( index, count ) )
+    with open( name, "w" ) as f:
+        for output in sorted( outputs ):
+            f.write( output + "\n" )
+
+
+def read_manifests( directory ):
+    '''Return `( index, count, outputs )' for each manifest found in the
+    output directory of a shard run'''
+    result = []
+    for name in sorted( os.listdir( directory ) ):
+        m = re_manifest.match( name )
+        if m:
+            with open( os.path.join( directory, name ) ) as f:
+                outputs = [line.rstrip( "\n" ) for line in f if line.strip()]
+            result.append( ( int( m.group( 1 ) ), int( m.group( 2 ) ),
+                             outputs ) )
+    return result
+
+# eof
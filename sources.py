@@ -29,7 +29,9 @@
 #
 
 
-import fileinput, re, string, converter, markdown
+import re, converter, markdown, utils, instrument
+import blockfilter
+import markdown_utils as mdutils
 
 
 ################################################################
@@ -117,6 +119,44 @@ re_source_block_format2 = SourceBlockFormat( 2, start, column, end )
 #
 re_source_block_formats = [re_source_block_format1, re_source_block_format2]
 
+
+#
+# A line that may start a documentation block of any of the formats above;
+# used to find all candidate blocks of a file with a single scan.  This
+# must match every line that one of the `start' patterns matches.
+#
+re_block_start = re.compile( r'''
+  ^[^\S\n]*     # any number of whitespace on the same line
+  /\*{2,}/?     # followed by '/' and at least two asterisks, maybe '/'
+  [^\S\n]*$     # probably followed by whitespace
+''', re.VERBOSE | re.MULTILINE )
+
+
+#
+# The same for the undecoded text of `utils.bytes_mode'.  The whitespace
+# class holds every byte that may be part of an encoded whitespace
+# character, so that this matches every line whose decoded text
+# `re_block_start' matches.
+#
+re_block_start_bytes = re.compile( rb'''
+  ^[ \t\r\f\v\x1c-\x1f\x80-\xff]*   # bytes that may be whitespace
+  /\*{2,}/?                         # then '/' and at least two asterisks
+  [ \t\r\f\v\x1c-\x1f\x80-\xff]*$   # bytes that may be whitespace
+''', re.VERBOSE | re.MULTILINE )
+
+
+def  split_lines( text ):
+    """Split `text' (a string or bytes) into lines like `fileinput'
+       does: at newlines only, keeping them."""
+    newline = b"\n" if isinstance( text, bytes ) else "\n"
+    lines = text.split( newline )
+    last  = lines.pop()
+    lines = [line + newline for line in lines]
+    if last:
+        lines.append( last )
+    return lines
+
+
 ################################################################
 ##
 ##  SOURCE BLOCK CLASS
@@ -132,15 +172,19 @@ re_source_block_formats = [re_source_block_format1, re_source_block_format2]
 ##      other blocks (i.e., sources or ordinary comments with no starting
 ##      markup tag)
 ##
+##    self.documentation
+##      True for comment blocks that were passed to the converter.
+##
 line_num = 1
 class SourceBlock:
 
-    def __init__( self, filename, lineno, lines ):
+    def __init__( self, filename, lineno, lines, documentation = False ):
         global line_num
         self.filename  = filename
         self.lineno    = lineno
         self.lines     = lines[:]
         self.content   = []
+        self.documentation = documentation
         # for i in lines:
         #     print(line_num, i, end='')
         #     line_num += 1
@@ -170,72 +214,232 @@ class  SourceProcessor:
         self.format   = None
         self.lines    = []
         if type == 1:
-            self.converter = converter.Converter()
+            self.converter     = converter.Converter()
+            self.classify      = converter.classify
+            self.classify_file = converter.classify_file
         elif type == 2:
-            self.converter = markdown.Markify()
+            self.converter     = markdown.Markify( utils.block_tables )
+            self.classify      = markdown.classify
+            self.classify_file = markdown.classify_file
         self.modline = None
         self.column_started = False
+        # a list to collect the documentation blocks to convert in, by
+        # line number, instead of converting them
+        self.deferred = None
+        # the `export.Exporter' to give every documentation block, if any
+        self.exporter = instrument.find( "export" )
+        # the `blockfilter.BlockFilter' selecting the blocks to convert
+        self.selected = None
+        if utils.only_sections or utils.only_symbols or utils.only_tags:
+            self.selected = blockfilter.BlockFilter( utils.only_sections,
+                                                     utils.only_symbols,
+                                                     utils.only_tags )
 
     def  reset( self ):
         """Reset a block processor and clean up all its blocks."""
         self.blocks = []
         self.format = None
+        # a code sequence left open by the previous file must not
+        # swallow the lines of this one
+        mdutils.reset()
+        if self.selected:
+            self.selected.reset()
 
+    @instrument.staged( "parse" )
     def  parse_file( self, filename ):
         """Parse a C source file and add its blocks to the processor's
-           list."""
+           list.  The file is read and scanned in pieces, see
+           `scan_pieces'."""
+        self.begin_file( filename )
+        pieces      = utils.read_source_pieces( filename )
+        self.blocks = list( self.scan_pieces( pieces ) )
+        return self.blocks
+
+    @instrument.staged( "read" )
+    def  read_file( self, filename ):
+        """Return the text of a source file."""
+        return utils.read_source( filename )
+
+    def  unchanged( self, text ):
+        """Return True if `scan_blocks' would give back `text' as it is
+           at first sight: it has no candidate start line, or
+           `classify_file' passes it through.  The file is counted as
+           `scan_blocks' counts it."""
+        start = re_block_start_bytes if isinstance( text, bytes ) \
+                else re_block_start
+        if ( self.converter and not self.exporter
+             and self.classify_file( text ) ):
+            instrument.count( "files passed through" )
+        elif start.search( text ):
+            return False
+        instrument.count( "files" )
+        instrument.count( "files unchanged" )
+        return True
+
+    def  scan_blocks( self, text, filename = None ):
+        """Parse C source held in a string and yield its blocks.  This
+           gives the same blocks as `iter_blocks', but the line by line
+           processing only runs from the candidate start lines found by
+           `re_block_start' to the end of their block; all other lines
+           are copied as they are.
+
+           `text' may also be bytes, see `utils.bytes_mode': then only the
+           lines that are processed are decoded, and the blocks hold the
+           other lines undecoded."""
+        self.begin_file( filename )
+        if ( self.converter and not self.exporter
+             and self.classify_file( text ) ):
+            # nothing in this file would be converted; with an exporter,
+            # its blocks are still needed
+            instrument.count( "files passed through" )
+            instrument.count( "files unchanged" )
+            self.lines   = split_lines( text )
+            self.linenum = len( self.lines )
+            self.add_block_lines()
+            for block in self.blocks:
+                yield block
+            self.blocks = []
+            return
+
+        for block in self.scan_pieces( [text] ):
+            yield block
+
+    def  begin_file( self, filename ):
+        """Reset the processor for the file `filename' and count it."""
         self.reset()
 
         self.filename = filename
 
-        fileinput.close()
         self.format = None
         self.lineno = 0
         self.lines  = []
         self.endlineno = 0
-        for line in fileinput.input( filename ):
+        self.linenum = 0
+        self.changed = False
+
+        instrument.count( "files" )
+
+    def  scan_pieces( self, pieces ):
+        """Do the work of `scan_blocks' for the text of a file given as
+           consecutive pieces that end at a line end; a block may go on
+           from one piece to the next.  `begin_file' must be called
+           first."""
+        for text in pieces:
+            binary  = isinstance( text, bytes )
+            start   = re_block_start_bytes if binary else re_block_start
+            newline = b"\n" if binary else "\n"
+
+            pos = 0     # position in `text' of the next line to process
+            if self.format != None:
+                # the block of the previous piece goes on
+                pos = self.scan_block( text, pos, binary, newline )
+
+            for match in start.finditer( text ):
+                if match.start() < pos:
+                    # already part of the previous block
+                    continue
+
+                lines = split_lines( text[pos:match.start()] )
+                self.lines.extend( lines )
+                self.linenum += len( lines )
+
+                pos = self.scan_block( text, match.start(), binary,
+                                       newline )
+
+                for block in self.blocks:
+                    yield block
+                self.blocks = []
+
+            # record the last lines
+            lines = split_lines( text[pos:] )
+            self.lines.extend( lines )
+            self.linenum += len( lines )
 
-            # DEBUG
-            # print("self.format =", self.format ,line, end ='')
+        self.add_block_lines()
+        for block in self.blocks:
+            yield block
+        self.blocks = []
+
+        if not self.changed:
+            instrument.count( "files unchanged" )
+
+    def  scan_block( self, text, pos, binary, newline ):
+        """Process the lines of `text' from position `pos' until a block
+           ends or `text' does.  Returns the position after them."""
+        while pos < len( text ):
+            end = text.find( newline, pos ) + 1 or len( text )
+            self.linenum += 1
+            line = text[pos:end]
+            self.process_line( utils.decode( line ) if binary else line )
+            pos = end
             if self.format == None:
-                self.process_normal_line( line )
-            else:
-                if self.format.end.match( line ):
-                    # A normal block end.  Add it to `lines' and create a
-                    # new block
-                    self.lines.append( line )
-                    # DEBUG
-                    #print(self.lines)
-                    # If column not started this may be a special block
-                    if not self.column_started:
-                        continue
-
-                    self.endlineno = fileinput.filelineno()
-                    # CALL TO REPLACE COMMENT FORMAT
-                    self.convert_comment()
-                    self.add_block_lines()
-                elif self.format.column.match( line ):
-                    # A normal column line.  Add it to `lines'.
-                    self.column_started = True
-                    self.lines.append( line )
-                else:
-                    # An unexpected block end.  Create a new block, but
-                    # don't process the line.
-                    # DEBUG
-                    #print(self.lines)
-                    self.endlineno = fileinput.filelineno()
-                    # CALL TO REPLACE COMMENT FORMAT
-                    self.convert_comment()
-                    self.add_block_lines()
-
-                    # we need to process the line again
-                    self.process_normal_line( line )
+                break
+        return pos
+
+    def  iter_blocks( self, lines, filename = None ):
+        """Parse an iterable of C source lines and yield each block as
+           soon as it is complete."""
+        self.reset()
+
+        self.filename = filename
+
+        self.format = None
+        self.lineno = 0
+        self.lines  = []
+        self.endlineno = 0
+        self.linenum = 0
+        for line in lines:
+            self.linenum += 1
+            self.process_line( line )
+
+            if self.blocks:
+                for block in self.blocks:
+                    yield block
+                self.blocks = []
 
         # record the last lines
         self.add_block_lines()
-        return self.blocks
+        for block in self.blocks:
+            yield block
+        self.blocks = []
 
-        
+    def  process_line( self, line ):
+        """Process a single line of the source."""
+        # DEBUG
+        # print("self.format =", self.format ,line, end ='')
+        if self.format == None:
+            self.process_normal_line( line )
+        else:
+            if self.format.end.match( line ):
+                # A normal block end.  Add it to `lines' and create a
+                # new block
+                self.lines.append( line )
+                # DEBUG
+                #print(self.lines)
+                # If column not started this may be a special block
+                if not self.column_started:
+                    return
+
+                self.endlineno = self.linenum
+                # CALL TO REPLACE COMMENT FORMAT
+                self.convert_comment()
+                self.add_block_lines( True )
+            elif self.format.column.match( line ):
+                # A normal column line.  Add it to `lines'.
+                self.column_started = True
+                self.lines.append( line )
+            else:
+                # An unexpected block end.  Create a new block, but
+                # don't process the line.
+                # DEBUG
+                #print(self.lines)
+                self.endlineno = self.linenum
+                # CALL TO REPLACE COMMENT FORMAT
+                self.convert_comment()
+                self.add_block_lines( True )
+
+                # we need to process the line again
+                self.process_normal_line( line )
 
     def  process_normal_line( self, line ):
         """Process a normal line and check whether it is the start of a new
@@ -244,28 +448,107 @@ class  SourceProcessor:
             if f.start.match( line ):
                 self.add_block_lines()
                 self.format = f
-                self.lineno = fileinput.filelineno()
+                self.lineno = self.linenum
                 self.column_started = False
 
         self.lines.append( line )
 
-    def  add_block_lines( self ):
+    def  add_block_lines( self, documentation = False ):
         """Add the current accumulated lines and create a new block."""
         if self.lines != []:
             block = SourceBlock( self.filename,
                                  self.lineno,
-                                 self.lines )
+                                 self.lines,
+                                 documentation )
 
             self.blocks.append( block )
             self.format = None
             self.lines  = []
 
+    @instrument.staged( "convert" )
     def  convert_comment( self ):
         """Get converted comment block and write back to file"""
-        if self.lines != []:
-            self.lines = self.converter.convert(self.lines)
+        if self.lines != [] and self.converter:
+            lines = self.lines
+            # lines read as bytes keep DOS line ends, which the converters
+            # don't expect; convert without them and put them back
+            dos = ( lines[-1].endswith( "\r\n" )
+                    and all( line.endswith( "\r\n" ) for line in lines ) )
+            if dos:
+                lines = [line[:-2] + "\n" for line in lines]
+
+            if self.selected and not self.selected.match( lines ):
+                instrument.count( "blocks passed through: not selected" )
+                # still exported, as it is: a `section' block sets the
+                # section of the records after it
+                if self.exporter:
+                    self.exporter.block( self.filename, self.lineno, lines )
+                return
+
+            # blocks that the converter would return as they are don't
+            # need to go through it
+            kind = self.classify( lines )
+            if kind:
+                instrument.count( "blocks passed through: " + kind )
+                if self.exporter:
+                    self.exporter.block( self.filename, self.lineno, lines )
+                return
+            instrument.count( "blocks converted" )
+            self.changed = True
+            if self.deferred is not None:
+                self.deferred.append( self.lineno )
+                return
+            lines = self.converter.convert( lines )
+            if self.exporter:
+                self.exporter.block( self.filename, self.lineno, lines )
+            if dos:
+                lines = [line.replace( "\n", "\r\n" ) for line in lines]
+            self.lines = lines
             #print(''.join(self.lines))
 
+    def  convert_range( self, text, first, last = None, filename = None ):
+        """Convert the documentation block of `text' that contains the
+           lines `first' to `last' (counting from 1), and nothing else.
+           Returns `( start, end, lines )', the line span of the block
+           and its converted lines, or None if no block contains the
+           range."""
+        last = last or first
+
+        # split the file up to the block without converting anything
+        converter      = self.converter
+        self.converter = None
+        try:
+            blocks = []
+            for block in self.scan_blocks( text, filename ):
+                if not block.documentation:
+                    continue
+                blocks.append( block )
+                if block.lineno + len( block.lines ) > last:
+                    break
+        finally:
+            self.converter = converter
+
+        if not blocks:
+            return None
+        target = blocks.pop()
+        end    = target.lineno + len( target.lines ) - 1
+        if not target.lineno <= first <= last <= end:
+            return None
+
+        # A code sequence left open by an earlier block goes on in this
+        # one (only `Markify' keeps such state).  Replay the blocks that
+        # may open one, i.e. have a line ending in `{', and those that
+        # start inside one.
+        mdutils.reset()
+        if isinstance( self.converter, markdown.Markify ):
+            for block in blocks:
+                if ( mdutils.mode == mdutils.mode_code
+                     or any( line.rstrip().endswith( "{" )
+                             for line in block.lines ) ):
+                    self.converter.convert( block.lines )
+
+        return target.lineno, end, self.converter.convert( target.lines )
+
     # debugging only, not used in normal operations
     def  dump( self ):
         """Print all blocks in a processor."""
@@ -0,0 +1,98 @@
+#
+#  timeline.py
+#
+#    Timeline of a conversion run in Chrome trace format (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+'''
+Record when every stage of the conversion runs, in each process, and
+write the result in the Chrome trace event format.  The file can be
+opened in `chrome://tracing', Perfetto or speedscope.
+
+`Timeline' is a listener for the stages of `instrument.py'.  Each process
+is a row of the timeline; the parent adds one row per worker slot with a
+span for every task it handed out, so idle slots and tasks that end in a
+timeout are visible even when the worker is killed.
+
+Time stamps are taken from `time.time', which all processes share.
+
+Typical usage:
+    timeline = timeline.Timeline( "main" )
+    instrument.listeners.append( timeline )
+    ...
+    timeline.write( "run.json" )
+'''
+from __future__ import print_function
+import json, os, time
+
+
+class Timeline:
+    '''Listener recording a span for every stage'''
+
+    key = "trace"
+
+    def __init__( self, role ):
+        self.pid    = os.getpid()
+        self.stack  = []
+        self.events = [ { "name": "process_name", "ph": "M",
+                          "pid" : self.pid, "tid": 0,
+                          "args": { "name": "%s %d" % ( role, self.pid ) } } ]
+
+    def enter( self, name, detail ):
+        self.stack.append( time.time() )
+
+    def leave( self, name, detail ):
+        begin = self.stack.pop()
+        args  = { "file": detail } if detail else None
+        self.add( name, begin, time.time(), args = args )
+
+    def add( self, name, begin, end, tid = 0, args = None ):
+        '''Add a span from `begin' to `end' (as returned by `time.time')
+        to row `tid' of this process.'''
+        event = { "name": name, "cat": "stage", "ph": "X",
+                  "ts"  : int( begin * 1000000 ),
+                  "dur" : int( ( end - begin ) * 1000000 ),
+                  "pid" : self.pid, "tid": tid }
+        if args:
+            event["args"] = args
+        self.events.append( event )
+
+    def thread( self, tid, name ):
+        '''Name row `tid' of this process.'''
+        self.events.append( { "name": "thread_name", "ph": "M",
+                              "pid" : self.pid, "tid": tid,
+                              "args": { "name": name } } )
+
+    def take( self ):
+        events      = self.events
+        self.events = []
+        return events
+
+    def merge( self, events ):
+        self.events.extend( events )
+
+    def write( self, filename ):
+        '''Write all events to `filename', with time starting at 0.'''
+        spans = [event["ts"] for event in self.events if "ts" in event]
+        start = min( spans ) if spans else 0
+        events = []
+        for event in self.events:
+            if "ts" in event:
+                event = dict( event, ts = event["ts"] - start )
+            events.append( event )
+        events.sort( key = lambda e: ( "ts" in e, e.get( "ts", 0 ),
+                                       e["pid"], e["tid"] ) )
+
+        with open( filename, "w" ) as f:
+            json.dump( { "traceEvents": events, "displayTimeUnit": "ms" },
+                       f, sort_keys = True )
+            f.write( "\n" )
+
+# eof
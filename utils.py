@@ -14,7 +14,8 @@
 #  understand and accept it fully.
 
 from __future__ import print_function
-import string, sys, os, glob, itertools, ntpath
+import string, sys, os, glob, itertools, ntpath, io, gzip, lzma, shutil
+import instrument, gitutils
 
 
 # current output directory
@@ -25,6 +26,102 @@ output_dir = None
 #
 flush_to_file = False
 
+# Lay out Markdown field tables one block at a time
+#
+block_tables = False
+
+# Convert each file in a separate process and continue after failures;
+# a file that takes longer than `timeout' seconds counts as failed
+#
+keep_going = False
+timeout    = 60
+
+# Number of worker processes
+#
+jobs = 1
+
+# Number of processes converting the blocks of a single large file
+#
+block_jobs = 1
+
+# Only convert files changed since this git revision
+#
+since = None
+
+# Read the input files from this git revision instead of the work tree
+#
+rev = None
+
+# The input files read from `rev', mapping their names to `( blob, size )'
+# tuples, see `gitutils.list_blobs'
+#
+blobs = {}
+
+# Skip the files that the journal in `output_dir' records as converted,
+# and record the files converted, see `journal.py'
+#
+resume = False
+
+# Only convert shard `shard[0]' of `shard[1]', see `shards.py'
+#
+shard = None
+
+# Compression of output files: None, "gz" or "xz"
+#
+compress = None
+
+# Read and write the inputs as bytes: only the lines of candidate
+# documentation blocks are decoded, and all other bytes are written back
+# as they were read, see `decode'
+#
+bytes_mode = False
+
+# Hard link output files that are copies of their input instead of
+# copying them, see `copy_source'
+#
+link = False
+
+# Only convert the documentation block containing the lines
+# `line_range[0]' to `line_range[1]'
+#
+line_range = None
+
+# Only convert the documentation blocks in these sections, with these
+# symbols, and with these tags, see `blockfilter.py'; all other blocks are
+# passed through
+#
+only_sections = []
+only_symbols  = []
+only_tags     = []
+
+# Write a memory profile of the conversion to this file, tracing this
+# many frames per allocation
+#
+memprofile = None
+memdepth   = 1
+
+# Print how many blocks and files were converted or passed through
+#
+stats = False
+
+# Write a call profile of the conversion to `profile'.pstats and
+# `profile'.folded
+#
+profile = None
+
+# Write a timeline of the conversion to this file, see `timeline.py'
+#
+trace = None
+
+# Write a record of every documentation block to this file, see
+# `export.py'
+#
+export = None
+
+# Suffixes of compressed input files
+#
+compressed_suffixes = ( ".gz", ".xz" )
+
 
 # Divert standard output to a given project documentation file.  Use
 # `output_dir' to determine the filename location if necessary and save the
@@ -33,16 +130,177 @@ flush_to_file = False
 def  open_output( filename ):
     global output_dir
 
-    if output_dir and output_dir != "":
-        filename = output_dir + os.sep + filename
+    filename = output_path( filename )
+
+    # an output hard linked to its input by `link' is replaced, so that
+    # writing it doesn't change the input
+    if os.path.isfile( filename ) and os.stat( filename ).st_nlink > 1:
+        os.unlink( filename )
 
     old_stdout = sys.stdout
-    new_file   = open( filename, "w" )
+    new_file   = open_compressed( filename, "w" )
     sys.stdout = new_file
 
     return ( new_file, old_stdout )
 
 
+# Return the path of output file `filename' in `output_dir'.
+#
+def  output_path( filename ):
+    if output_dir and output_dir != "":
+        return output_dir + os.sep + filename
+    return filename
+
+
+# Open a file for reading or writing text, compressing or decompressing
+# it on the fly if its name ends in `.gz' or `.xz'.  This also serves as
+# the `openhook' for `fileinput'.  Compressed output doesn't record a
+# time stamp, so that identical text gives identical files.
+#
+def  open_compressed( filename, mode = "r" ):
+    mode = mode.replace( "t", "" )
+    if filename.endswith( ".gz" ):
+        if "r" in mode:
+            return gzip.open( filename, mode + "t" )
+        return io.TextIOWrapper( gzip.GzipFile( filename, mode + "b",
+                                                mtime = 0 ) )
+    if filename.endswith( ".xz" ):
+        return lzma.open( filename, mode + "t" )
+    return open( filename, mode )
+
+
+# Return the text of input file `filename', read from its blob in `rev' if
+# it has one.  Blobs are decoded like files opened in text mode.
+#
+def  read_source( filename ):
+    if filename not in blobs:
+        with open_compressed( filename ) as f:
+            return f.read()
+
+    return io.TextIOWrapper( io.BytesIO( read_data( filename ) ) ).read()
+
+
+# Yield the text of input file `filename' like `read_source', in pieces
+# of about `size' characters that end at a line end (except maybe the
+# last), so that the whole text is never held at once.  A blob of `rev'
+# is read in one piece.
+#
+def  read_source_pieces( filename, size = 8192 ):
+    if filename in blobs:
+        yield read_source( filename )
+        return
+
+    with open_compressed( filename ) as f:
+        rest = ""
+        while True:
+            chunk = f.read( size )
+            if not chunk:
+                break
+            end = chunk.rfind( "\n" ) + 1
+            if not end:
+                rest += chunk
+                continue
+            yield rest + chunk[:end]
+            rest = chunk[end:]
+        if rest:
+            yield rest
+
+
+# Return the bytes of input file `filename', decompressed, and read from
+# its blob in `rev' if it has one.
+#
+def  read_data( filename ):
+    if filename in blobs:
+        data = gitutils.read_blob( blobs[filename][0] )
+    else:
+        with open( filename, "rb" ) as f:
+            data = f.read()
+    if filename.endswith( ".gz" ):
+        data = gzip.decompress( data )
+    elif filename.endswith( ".xz" ):
+        data = lzma.decompress( data )
+    return data
+
+
+# Decode a line of `bytes_mode'.  Undecodable bytes become lone surrogates
+# that `encode' turns back into the same bytes, so that lines which are
+# not converted are written back exactly.
+#
+def  decode( line ):
+    return line.decode( "utf-8", "surrogateescape" )
+
+def  encode( line ):
+    return line.encode( "utf-8", "surrogateescape" )
+
+
+# Return `( text, data )' for input file `filename': its text as
+# `read_source' returns it (its bytes with `bytes_mode'), and its bytes if
+# an unchanged output can be a copy of them, else None.  That needs an
+# output file without `compress' and an uncompressed input; in text mode
+# also one without carriage returns, which become line feeds.
+#
+def  read_input( filename ):
+    copy = ( flush_to_file and not compress
+             and not filename.endswith( compressed_suffixes ) )
+    if bytes_mode:
+        data = read_data( filename )
+        return data, ( data if copy else None )
+    if not copy:
+        return read_source( filename ), None
+
+    data = read_data( filename )
+    text = io.TextIOWrapper( io.BytesIO( data ) ).read()
+    return text, ( None if b"\r" in data else data )
+
+
+# Write input `filename' unchanged to its output file; `data' are its
+# bytes as returned by `read_input'.  Files of the work tree are hard
+# linked with `link', or else copied by the kernel with `copy_file',
+# without passing through Python; blobs of `rev' are written from `data'.
+#
+def  copy_source( filename, data ):
+    name = output_name( filename )
+    create_dirs( name )
+    target = output_path( name )
+
+    if filename in blobs:
+        with open( target, "wb" ) as f:
+            f.write( data )
+        return
+
+    if os.path.exists( target ) and os.path.samefile( filename, target ):
+        # the output is the input, or already linked to it
+        return
+    if os.path.lexists( target ):
+        os.unlink( target )
+    if link:
+        try:
+            os.link( filename, target )
+            return
+        except OSError:
+            # e.g. on another file system; copy instead
+            pass
+    copy_file( filename, target )
+
+
+# Copy file `source' to `target' with `os.copy_file_range', which lets
+# file systems like Btrfs or XFS share the data of both files, or else
+# with `shutil.copyfile'.
+#
+def  copy_file( source, target ):
+    if hasattr( os, "copy_file_range" ):
+        try:
+            with open( source, "rb" ) as src, open( target, "wb" ) as dst:
+                while os.copy_file_range( src.fileno(), dst.fileno(),
+                                          1 << 30 ):
+                    pass
+            return
+        except OSError:
+            # not supported between these files; start over
+            pass
+    shutil.copyfile( source, target )
+
+
 # Close the output that was returned by `open_output'.
 #
 def  close_output( output ):
@@ -80,14 +338,27 @@ def  file_exists( pathname ):
 
 def  make_file_list( args = None ):
     """Build a list of input files from command-line arguments."""
+    global blobs
     file_list = []
     # sys.stderr.write( repr( sys.argv[1 :] ) + '\n' )
 
     if not args:
         args = sys.argv[1:]
 
+    if rev:
+        # the arguments name files in a git revision
+        try:
+            blobs = gitutils.list_blobs( rev, args )
+        except gitutils.GitError as e:
+            sys.stderr.write( str( e ) + "\n" )
+            sys.exit( 2 )
+        return sorted( blobs ) or None
+
     for pathname in args:
-        if pathname.find('*') >= 0:
+        if pathname == "-":
+            # standard input, see `batch.process_stream'
+            newpath = [pathname]
+        elif pathname.find('*') >= 0:
             newpath = glob.glob( pathname )
             newpath.sort()  # sort files -- this is important because
                             # of the order of files
@@ -100,7 +371,7 @@ def  make_file_list( args = None ):
         file_list = None
     else:
         # now filter the file list to remove non-existing ones
-        file_list = filter( file_exists, file_list )
+        file_list = [f for f in file_list if f == "-" or file_exists( f )]
 
     return file_list
 
@@ -109,7 +380,13 @@ def create_dirs( filename ):
     global output_dir
     dirname = output_dir + os.sep + os.path.dirname( filename )
     if dirname and not os.path.isdir( dirname ):
-        os.makedirs( dirname )
+        try:
+            os.makedirs( dirname )
+        except OSError:
+            # a worker process may have created it in the meantime
+            if not os.path.isdir( dirname ):
+                raise
+            return
         print("created directory",dirname)
 
 def get_filename( filename ):
@@ -126,24 +403,52 @@ def get_filename( filename ):
     return (os.path.sep).join(new_path_split)
 
 
+@instrument.staged( "join" )
+def blocks_to_text( blocks ):
+    """Join the lines of all blocks into a single string"""
+    return "".join( [line for block in blocks for line in block.lines] )
+
+@instrument.staged( "join" )
+def blocks_to_bytes( blocks ):
+    """Join the lines of all blocks of `bytes_mode`, undecoded or decoded,
+    into a single byte string"""
+    return b"".join( [line if isinstance( line, bytes ) else encode( line )
+                      for block in blocks for line in block.lines] )
+
 def write_to_file( blocks, filename ):
     """Write list of blocks to file `filename`"""
-    line_num = 1
+    write_text( blocks_to_text( blocks ), filename )
+
+def output_name( filename ):
+    """
+    Get the relative output path for input `filename`.
+    The compression suffix of the input is dropped, and the one
+    selected by `compress` is added.
+    """
+    filename = get_filename( filename )
+    for suffix in compressed_suffixes:
+        if filename.endswith( suffix ):
+            filename = filename[:-len( suffix )]
+    if compress:
+        filename += "." + compress
+    return filename
+
+def write_text( text, filename ):
+    """Write converted text (or bytes) for input `filename` to its output
+    file"""
     output = None
 
     if flush_to_file:
-        filename = get_filename( filename )
+        filename = output_name( filename )
         create_dirs( filename )
         output = open_output( filename )
 
-    for block in blocks:
-        lines = block.lines
+    if isinstance( text, bytes ):
+        sys.stdout.flush()
+        sys.stdout.buffer.write( text )
+    else:
+        print(text, end='', sep='')
 
-        for i in lines:
-            # print(line_num, '\t', i, end='', sep='')
-            print(i, end='', sep='')
-            line_num += 1
-    
     if output:
         close_output( output )
 # eof
@@ -0,0 +1,291 @@
+#
+#  workload.py
+#
+#    Seeded generator of synthetic FreeType-style headers (library file).
+#
+#  Copyright 2018 by
+#  Nikhil Ramakrishnan.
+#
+#  This file is part of the FreeType project, and may only be used,
+#  modified, and distributed under the terms of the FreeType project
+#  license, LICENSE.TXT.  By continuing to use, modify, or distribute
+#  this file you indicate that you have read the license and
+#  understand and accept it fully.
+"""
+Generate comment blocks and headers that look like the ones found in
+the FreeType sources.  Everything is driven by a `random.Random'
+instance, so the same seed always yields the same text.
+
+Typical usage:
+    import random, workload
+    rng   = random.Random( 42 )
+    lines = workload.heavy_block( rng )
+"""
+from __future__ import print_function
+import random
+
+
+# Words used to build descriptions.
+#
+words = [ "the", "face", "glyph", "value", "of", "a", "is", "to", "in",
+          "font", "size", "pixel", "outline", "bitmap", "returns", "handle",
+          "this", "field", "units", "set", "must", "be", "for", "an",
+          "object", "stream", "driver", "charmap", "index", "metrics" ]
+
+# Fragments that exercise the quote and inline code rules.
+#
+quoted = [ "`face->size'", "`bbox.yMax'", "`FT_LOAD_DEFAULT'",
+           "`units_per_EM'", "`numGlyphs'", "`Times New Roman'",
+           "`a + b = c'", "`ttc '", "`x'" ]
+
+symbols = [ "FT_Face", "FT_FaceRec", "FT_Load_Glyph", "FT_Set_Char_Size",
+            "FT_Outline", "FT_Bitmap", "FT_Stream_Open", "FT_Get_Kerning",
+            "FT_Size_Metrics", "FT_Library_Version", "FT_Glyph_Format" ]
+
+sections = [ "gzip", "base_interface", "glyph_management", "outline_processing",
+             "bitmap_handling", "computations", "module_management" ]
+
+tags = [ "Description", "Note", "Return", "Since", "Also", "Order" ]
+
+field_tags = [ "Fields", "Values", "Input", "Output", "InOut" ]
+
+
+def  sentence( rng, quotes = True ):
+    """Return a random sentence made of `words' and `quoted'."""
+    count  = rng.randint( 3, 12 )
+    result = []
+    for i in range( count ):
+        if quotes and rng.random() < 0.1:
+            result.append( rng.choice( quoted ) )
+        else:
+            result.append( rng.choice( words ) )
+    return " ".join( result ) + "."
+
+
+def  paragraph( rng, width = 60 ):
+    """Return a list of text lines no longer than `width' characters."""
+    text  = " ".join( sentence( rng ) for i in range( rng.randint( 1, 4 ) ) )
+    lines = []
+    cur   = ""
+    for word in text.split( " " ):
+        if cur and len( cur ) + len( word ) + 1 > width:
+            lines.append( cur )
+            cur = word
+        else:
+            cur = cur + " " + word if cur else word
+    if cur:
+        lines.append( cur )
+    return lines
+
+
+def  code_sequence( rng ):
+    """Return the lines of a `{ ... }' code sequence."""
+    lines = [ "{" ]
+    for i in range( rng.randint( 1, 4 ) ):
+        lines.append( "  " + rng.choice( symbols ) + "( "
+                      + rng.choice( words ) + " );" )
+    lines.append( "}" )
+    return lines
+
+
+def  block_content( rng, fields = True, code = True ):
+    """Return the unboxed content of a documentation block as a list of
+       `( tag, lines )' tuples.  Tag lines have no indentation, content
+       lines are relative to the tag."""
+    sections = [ ( "Function", [ rng.choice( symbols ) ] ) ]
+    for tag in rng.sample( tags, rng.randint( 1, 3 ) ):
+        body = paragraph( rng )
+        if code and rng.random() < 0.2:
+            body += [ "" ] + code_sequence( rng )
+        sections.append( ( tag, body ) )
+
+    if fields and rng.random() < 0.7:
+        body  = []
+        names = [ rng.choice( words ) + "_" + rng.choice( words )
+                  for i in range( rng.randint( 1, 8 ) ) ]
+        width = max( len( n ) for n in names )
+        for name in names:
+            desc = paragraph( rng, 40 )
+            body.append( name.ljust( width ) + " :: " + desc[0] )
+            for line in desc[1:]:
+                body.append( " " * ( width + 4 ) + line )
+            if rng.random() < 0.5:
+                body.append( "" )
+        sections.append( ( rng.choice( field_tags ), body ) )
+
+    return sections
+
+
+def  heavy_block( rng, indent = 2 ):
+    """Return a documentation block in the old `heavy' format (format 1)
+       as a list of newline-terminated lines."""
+    pre   = " " * indent
+    width = 77 - indent
+    rule  = pre + "/" + "*" * ( width - 2 ) + "/\n"
+
+    def  boxed( text ):
+        return pre + "/* " + text.ljust( width - 6 ) + " */\n"
+
+    lines = [ rule, boxed( "" ) ]
+    for tag, body in block_content( rng ):
+        lines.append( boxed( "<" + tag + ">" ) )
+        for line in body:
+            lines.append( boxed( "   " + line if line else "" ) )
+        lines.append( boxed( "" ) )
+    lines.append( rule )
+    return lines
+
+
+def  light_block( rng, indent = 2 ):
+    """Return a documentation block in the new `light' format (format 2)
+       as a list of newline-terminated lines."""
+    pre   = " " * indent
+    lines = [ pre + "/" + "*" * ( 74 - indent ) + "\n", pre + " *\n" ]
+    for tag, body in block_content( rng ):
+        lines.append( pre + " * @" + tag + ":\n" )
+        for line in body:
+            if line:
+                lines.append( pre + " *   " + line + "\n" )
+            else:
+                lines.append( pre + " *\n" )
+        lines.append( pre + " *\n" )
+    lines.append( pre + " */\n" )
+    return lines
+
+
+# Lines that make regular expressions with overlapping quantifiers
+# backtrack, as functions of a repeat count.  Each of them took time
+# that grew with the square (or more) of its length in some rule of the
+# engines before.
+#
+adversarial = [
+    ( "dotted quote",   lambda n: "`" + "a." * n ),
+    ( "arrow quote",    lambda n: "`" + "a->" * n + "*'x" ),
+    ( "camel quote",    lambda n: "`a" + "B" * n + "!'x" ),
+    ( "open quotes",    lambda n: "` " * n ),
+    ( "closed quotes",  lambda n: "`a'" * n ),
+    ( "blank field",    lambda n: " " * n + "a" ),
+    ( "dotted field",   lambda n: "a." * n + "a" ),
+    ( "blank tag",      lambda n: "<a>" + " " * n + "x" ),
+    ( "emphasis",       lambda n: "_a_ *b* " * n ),
+    ( "comment starts", lambda n: "/*a" * n ) ]
+
+
+def  adversarial_blocks( text, indent = 2 ):
+    """Return a block of each format with `text' in a section and in a
+       field description, as lists of newline-terminated lines."""
+    pre   = " " * indent
+    rule  = pre + "/" + "*" * ( 75 - indent ) + "/\n"
+    heavy = [ rule, pre + "/* <Description> */\n",
+              pre + "/*    " + text + " */\n",
+              pre + "/* <Fields> */\n",
+              pre + "/*    x :: " + text + " */\n",
+              pre + "/*    " + text + "\n", rule ]
+    light = [ pre + "/" + "*" * ( 74 - indent ) + "\n",
+              pre + " * @Description:\n",
+              pre + " *   " + text + "\n",
+              pre + " * @Fields:\n",
+              pre + " *   x ::\n",
+              pre + " *     " + text + "\n",
+              pre + " */\n" ]
+    return heavy, light
+
+
+def  mutated_block( rng ):
+    """Return a random block of either format, with some of the quirks
+       the engines have to preserve: commented `#define' lines, special
+       blocks that repeat the start line, stray comment ends, trailing
+       blanks, odd indentation, unbalanced braces and backquotes."""
+    light = rng.random() < 0.5
+    if light:
+        lines = light_block( rng, rng.choice( [ 0, 2, 2, 4 ] ) )
+    else:
+        lines = heavy_block( rng, rng.choice( [ 0, 2, 2, 4 ] ) )
+
+    for i in range( rng.randint( 0, 4 ) ):
+        pos  = rng.randint( 1, len( lines ) - 1 )
+        line = lines[pos]
+        kind = rng.randint( 0, 9 )
+        if kind == 0:
+            lines.insert( pos, "/* #define FT_CONFIG_OPTION_"
+                               + rng.choice( words ).upper() + " */\n" )
+        elif kind == 1:
+            lines.insert( 1, lines[0] )
+        elif kind == 2:
+            lines[pos] = line[:-1] + "   \n"
+        elif kind == 3:
+            lines[pos] = line[:-1] + " */\n"
+        elif kind == 4:
+            lines[pos] = " " + line
+        elif kind == 5:
+            lines[pos] = line.replace( "   ", "    ", 1 )
+        elif kind == 6:
+            lines.insert( pos, line[:line.find( "*" ) + 1]
+                               + rng.choice( [ "   {", "   }", " {", "" ] )
+                               + ( " */" if not light else "" ) + "\n" )
+        elif kind == 7:
+            lines[pos] = line.replace( " ", " `" + rng.choice( words ) + " ", 1 )
+        elif kind == 8:
+            lines[pos] = line.replace( "<", "", 1 ).replace( "@", "", 1 )
+        else:
+            del lines[pos]
+    return lines
+
+
+def  section_block( rng, light = False ):
+    """Return a section documentation block in either format."""
+    name = rng.choice( sections )
+    if light:
+        return [ "  /" + "*" * 72 + "\n",
+                 "   *\n",
+                 "   * @Section:\n",
+                 "   *   " + name + "\n",
+                 "   *\n",
+                 "   * @Title:\n",
+                 "   *   " + name.replace( "_", " " ).title() + "\n",
+                 "   *\n",
+                 "   */\n" ]
+
+    def  boxed( text ):
+        return "  /* " + text.ljust( 69 ) + " */\n"
+
+    return [ "  /" + "*" * 73 + "/\n",
+             boxed( "" ),
+             boxed( "<Section>" ),
+             boxed( "   " + name ),
+             boxed( "" ),
+             boxed( "<Title>" ),
+             boxed( "   " + name.replace( "_", " " ).title() ),
+             boxed( "" ),
+             "  /" + "*" * 73 + "/\n" ]
+
+
+def  code_lines( rng ):
+    """Return a few lines of plain C declarations."""
+    lines = [ "\n" ]
+    for i in range( rng.randint( 1, 6 ) ):
+        name = rng.choice( symbols )
+        lines.append( "  FT_EXPORT( FT_Error )\n" )
+        lines.append( "  " + name + "( FT_Face  face,\n" )
+        lines.append( "  " + " " * len( name ) + "  FT_UInt  "
+                      + rng.choice( words ) + " );\n" )
+        lines.append( "\n" )
+    return lines
+
+
+def  header( rng, blocks = 20, light = False ):
+    """Return the lines of a synthetic header file with `blocks'
+       documentation blocks, separated by plain C code."""
+    lines = [ "#ifndef FOO_H_\n", "#define FOO_H_\n", "\n" ]
+    lines += section_block( rng, light )
+    for i in range( blocks ):
+        lines += code_lines( rng )
+        if light:
+            lines += light_block( rng )
+        else:
+            lines += heavy_block( rng )
+    lines += code_lines( rng )
+    lines += [ "#endif /* FOO_H_ */\n", "\n", "/* END */\n" ]
+    return lines
+
+# eof